@@ -1,13 +1,3 @@
-import os
-import sys
-from argparse import ArgumentParser
-from datetime import date
-
-import ROOT
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from SNDstyle import init_style, writeSND
-
-today = date.today().strftime('%d%m%y')
 """
     SNDLHCplotter.py    A multi-purpose histogram plotter for SND@LHC (D. Centanni 2023)
 
@@ -26,6 +16,37 @@ today = date.today().strftime('%d%m%y')
     | --scale           | Specify the scale factor to be applied to each histogram.                                             |
     | --auto            | Enables the auto mode: automatically plots histograms according to the arguments provided.            |
     | --dataMC          | Enables the Data-MonteCarlo comparison mode: data histogram must contain DATA in its name! (for now). |
+    | --ratio           | In dataMC mode, adds a lower panel with the Data/MC ratio, or with the pulls (--ratio pull).        |
+    | --scan            | Ranks all the DATA/MC pairs of the input file by compatibility and draws the N worst (default: 10).   |
+    | --downsample      | Merges the bins of 2D histograms down to the frame resolution, with sum, mean or max.                |
+    | --raster          | Embeds the colour map of 2D histograms as an image, axes, palette and text stay vector graphics.    |
+    | --rebin-relerr    | Variable-width rebinning of 1D histograms: merges adjacent bins up to this relative error per bin.  |
+    | --rebin-min       | Variable-width rebinning of 1D histograms: merges adjacent bins up to this number of entries per bin. |
+    | --variants        | In auto-mode, draws each 1D histogram linear and log, raw and normalized (<name>_[norm_]lin/log).     |
+    | --sep             | Packs the -hname histograms into pages of pads, streamed out one page at a time, with a contents page. |
+    | --grid            | Pads per page in --sep mode, NXxNY (default: 3x2, fewer for fewer plots).                             |
+    | --pagesize        | Page size in pixels in --sep mode, WxH; without --grid, as many 400x330 pads as fit.                  |
+    | --list            | Lists the histograms of the input file(s) from the index, without reading them, and exits.           |
+    | --noindex         | Does not use (nor write) the sidecar index of the input files.                                        |
+    | -j, --jobs        | Number of worker processes used to render all histograms of a file in auto-mode, or a job file (default: 1). |
+    | --stream          | Auto-mode over a whole file, one histogram at a time on a reused canvas: memory stays flat.         |
+    | --prefetch        | Reads the next N histograms (or files, canvases) in a background thread while drawing the current one. |
+    | --watch           | Polls the input file and redraws the histograms (the -hname ones if given) with a new cycle (optional poll interval, 0.5 s). |
+    | --merge           | Sums the histograms given with -hname over all the input files, and plots the sums.                  |
+    | --threads         | Number of threads reading the input files in merge mode (default: 0, serial reading), or filling in --fill mode. |
+    | --jobfile         | Draws all the plots of a JSON/YAML job file (see SNDjobs.py), reading each input once; -j draws independent groups in parallel. |
+    | --fill            | Fills the histograms of a JSON config (see SNDfill.py) from TTrees in a single multithreaded pass and plots them. |
+    | --style           | Draws all plots with this style (e.g. SND-paper) instead of SND-single, SND-multi or SND-2D.          |
+    | --logo            | Image file (e.g. the SND@LHC logo) drawn in the top right corner of every plot, loaded once.          |
+    | --onefile         | Writes all plots as the pages of a single PDF (default name: plots_<input>/<input>.pdf).              |
+    | --canvasfile      | In --onefile mode, also writes the canvases into this ROOT file.                                     |
+    | --formats         | Comma-separated output formats, each canvas is drawn once and saved in all of them (default: pdf).  |
+    | --pngwidth        | Width in pixels of the png outputs (default: canvas size).                                           |
+    | --thumbnail       | Also writes <plot>_thumb.png thumbnails of this width in pixels, with the png format.               |
+    | --incremental     | Only redraws the plots whose histograms or drawing parameters changed since the last run.            |
+    | --profile         | Prints the time spent opening, reading, transforming, styling, drawing and saving, and writes it with per-histogram rows into a JSON file (default: profile.json). |
+    | --serve           | Starts a plotting server on the given unix socket, keeping ROOT, the style and the input files warm.  |
+    | --submit          | Sends the other options as a job to the server on the given unix socket and waits for the output.   |
 
     Examples
     --------
@@ -35,107 +56,849 @@ today = date.today().strftime('%d%m%y')
         python -i SNDLHCplotter.py -f histofile.root -hname Nscifi_hits1 Nscifi_hits3 Nscifi_hits3 -e Preliminary --auto
     3. Auto-mode, Data-Montecarlo comparison:
         python -i SNDLHCplotter.py -f histofile.root -hname DATA_Nscifi_hits MC_Nscifi_hits --auto --dataMC
-    4. ...
+    4. Auto-mode, all histograms of a file rendered by 16 worker processes:
+        python SNDLHCplotter.py -f histofile.root -e Preliminary --auto --jobs 16
+    5. Plotting server and client:
+        python SNDLHCplotter.py --serve /tmp/sndplotter.sock &
+        python SNDLHCplotter.py --submit /tmp/sndplotter.sock -f histofile.root -hname Nscifi_hits -e Preliminary --auto
+    6. ...
 
     Still WIP
 """
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from collections.abc import Mapping
+from datetime import date
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import SNDfill
+import SNDindex
+import SNDjobs
+import SNDprefetch
+import SNDprofile
+import SNDstats
+import SNDstyle
+import SNDtransform
+from SNDstyle import ROOT, STYLE_VERSION, forceStyle, init_style, ratioPads, setLogo, styleAxes, useStyle, writeSND
 
-def load_hists(histfile, query=None):
-    f = ROOT.TFile.Open(histfile)
-    histlist = {}
-    keylist = f.GetListOfKeys()
-    for key in keylist:
-        if query is not None and key.GetName() not in query:
-            continue
-        hist = f.Get(key.GetName())
-        # check if histogram is readable
-        try:
+today = date.today().strftime('%d%m%y')
+
+# files kept open between jobs (server mode), {path: (size, mtime, TFile)} in LRU order
+_openFiles = None
+_maxOpenFiles = 8
+# output files written by saveCanvas
+savedFiles = list()
+# Manifest of the incremental mode
+_manifest = None
+# MultiPageOutput collecting all the canvases, if any
+_multipage = None
+# default output formats of saveCanvas, width in pixels of the png files and of their thumbnails
+outputFormats = ('pdf',)
+pngWidth = None
+thumbWidth = None
+
+
+def openFile(path):
+    # remote files are not kept open, their size and mtime are not known
+    if _openFiles is None or not SNDindex.isLocal(path):
+        return ROOT.TFile.Open(path)
+    st = os.stat(path)
+    cached = _openFiles.pop(path, None)
+    if cached is not None and cached[:2] == (st.st_size, st.st_mtime):
+        _openFiles[path] = cached
+        return cached[2]
+    if cached is not None: cached[2].Close()
+    f = ROOT.TFile.Open(path)
+    _openFiles[path] = (st.st_size, st.st_mtime, f)
+    while len(_openFiles) > _maxOpenFiles:
+        _openFiles.pop(next(iter(_openFiles)))[2].Close()
+    return f
+
+def closeFile(f):
+    # files kept open by openFile are closed when evicted
+    if _openFiles is None or all(cached[2] is not f for cached in _openFiles.values()):
+        f.Close()
+
+def setOutputFormats(formats, pngwidth=None, thumbwidth=None):
+    global outputFormats, pngWidth, thumbWidth
+    if isinstance(formats, str): formats = formats.split(',')
+    outputFormats = tuple(fmt.strip().lower() for fmt in formats if fmt.strip())
+    pngWidth = pngwidth
+    thumbWidth = thumbwidth
+
+def outputFiles(basename, formats=None):
+    if formats is None: formats = outputFormats
+    files = [basename+'.'+fmt for fmt in formats]
+    if thumbWidth and 'png' in formats: files.append(basename+'_thumb.png')
+    return files
+
+def _writePNG(canvas, filename):
+    # the canvas is painted once into an image, which is then scaled for the png and the thumbnail
+    img = ROOT.TImage.Create()
+    img.FromPad(canvas)
+    ratio = float(img.GetHeight())/img.GetWidth()
+    if pngWidth:
+        img.Scale(int(pngWidth), int(pngWidth*ratio))
+    img.WriteImage(filename)
+    files = [filename]
+    if thumbWidth:
+        img.Scale(int(thumbWidth), int(thumbWidth*ratio))
+        img.WriteImage(filename[:-4]+'_thumb.png')
+        files.append(filename[:-4]+'_thumb.png')
+    return files
+
+def saveCanvas(canvas, basename, formats=None):
+    # writes the canvas, drawn once, in all the requested formats (outputFormats by default).
+    # The draw functions do not repaint: in batch mode each output paints the pad tree itself,
+    # on screen the canvas is updated once here
+    # formats=() only draws, e.g. the pads of a page
+    if formats == (): return
+    if not ROOT.gROOT.IsBatch(): canvas.Update()
+    if _multipage is not None:
+        with SNDprofile.stage('save page'):
+            _multipage.add(canvas, os.path.basename(basename))
+        return
+    if formats is None: formats = outputFormats
+    for fmt in formats:
+        filename = basename+'.'+fmt
+        with SNDprofile.stage('save '+fmt):
+            if fmt == 'png' and (pngWidth or thumbWidth):
+                savedFiles.extend(_writePNG(canvas, filename))
+                continue
+            canvas.SaveAs(filename, fmt)
+        savedFiles.append(filename)
+    if _manifest is not None: _manifest.record(basename)
+
+class MultiPageOutput(object):
+    """
+    Streams canvases into the pages of a single PDF, with a bookmark named after each plot,
+    and optionally writes them into a ROOT file as well.
+    """
+    def __init__(self, filename, rootfile=None):
+        self.filename = filename
+        self.rootfile = rootfile
+        self.pages = list()
+        self._rootfile = None
+        if rootfile:
+            self._rootfile = ROOT.TFile.Open(rootfile, 'RECREATE')
+            ROOT.gROOT.cd()
+
+    def add(self, canvas, name):
+        if not self.pages: canvas.Print(self.filename+'[')
+        canvas.Print(self.filename, 'Title:'+name)
+        self.pages.append(name)
+        if self._rootfile is not None:
+            self._rootfile.cd()
+            canvas.Write(name)
+            ROOT.gROOT.cd()
+
+    def close(self):
+        if self.pages:
+            # any canvas can close the file
+            closer = ROOT.TCanvas('closemultipage', '', 10, 10)
+            closer.Print(self.filename+']')
+            closer.Close()
+            savedFiles.append(self.filename)
+            print(self.filename, 'written with', len(self.pages), 'pages')
+        if self._rootfile is not None:
+            self._rootfile.Close()
+            self._rootfile = None
+            savedFiles.append(self.rootfile)
+
+def setMultiPage(filename, rootfile=None):
+    # from now on, saveCanvas adds pages to filename instead of writing one file per plot
+    global _multipage
+    _multipage = MultiPageOutput(filename, rootfile)
+
+def finishMultiPage():
+    global _multipage
+    if _multipage is not None:
+        _multipage.close()
+        _multipage = None
+
+def histDigest(hist):
+    # hash of binning, bin contents and errors of a histogram
+    import hashlib
+    from array import array
+    digest = hashlib.sha1()
+    digest.update(str((hist.IsA().GetName(), hist.GetName(), hist.GetTitle(), hist.GetEntries())).encode())
+    for ax in (hist.GetXaxis(), hist.GetYaxis(), hist.GetZaxis()):
+        digest.update(str((ax.GetNbins(), ax.GetXmin(), ax.GetXmax(), ax.GetTitle())).encode())
+        if ax.IsVariableBinSize():
+            digest.update(array('d', [ax.GetBinLowEdge(i) for i in range(1, ax.GetNbins()+2)]).tobytes())
+    content = SNDstats.contentView(hist)
+    if content is not None:
+        digest.update(content.tobytes())
+        if hist.GetSumw2N() > 0: digest.update(SNDstats.sumw2View(hist).tobytes())
+        return digest.hexdigest()
+    nbins = hist.GetSize()
+    digest.update(array('d', [hist.GetBinContent(i) for i in range(nbins)]).tobytes())
+    if hist.GetSumw2N() > 0:
+        digest.update(array('d', [hist.GetBinError(i) for i in range(nbins)]).tobytes())
+    return digest.hexdigest()
+
+class Manifest(object):
+    """
+    Record of the inputs of every output of a directory: a hash of the drawn histograms,
+    of the drawing parameters and of the style version. Used by the incremental mode.
+    """
+    def __init__(self, outpath):
+        import json
+        self.path = os.path.join(outpath, '.sndmanifest.json')
+        self.entries = {}
+        self.updated = {}
+        self._pending = {}
+        if os.path.exists(self.path):
+            with open(self.path) as fin:
+                self.entries = json.load(fin)
+
+    def upToDate(self, basename, outputs, hists, params):
+        import hashlib
+        digest = hashlib.sha1(str((STYLE_VERSION, sorted(params.items()))).encode())
+        for hist in hists:
+            digest.update(histDigest(hist).encode())
+        key = digest.hexdigest()
+        self._pending[basename] = key
+        return self.entries.get(basename) == key and all(os.path.exists(f) for f in outputs)
+
+    def record(self, basename):
+        if basename in self._pending:
+            self.entries[basename] = self.updated[basename] = self._pending.pop(basename)
+
+    def save(self):
+        import json
+        tmp = self.path+'.tmp'
+        with open(tmp, 'w') as fout:
+            json.dump(self.entries, fout, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+def setIncremental(outpath):
+    # from now on, draw functions skip outputs whose inputs did not change since the last run
+    global _manifest
+    _manifest = Manifest(outpath)
+
+def finishIncremental():
+    global _manifest
+    if _manifest is not None:
+        _manifest.save()
+        _manifest = None
+
+def _skipUnchanged(basename, hists, params):
+    if _manifest is None or params.get('formats') == (): return False
+    outputs = outputFiles(basename, params.get('formats'))
+    params = {k: repr(v) for k, v in params.items() if k not in ('hist', 'histlist', 'canvas', 'c1')}
+    params['formats'] = repr((outputs, pngWidth, thumbWidth))
+    params['style'] = repr((SNDstyle.forcedStyle, SNDstyle.logoFile))
+    if _manifest.upToDate(basename, outputs, hists, params):
+        print(basename, 'is up to date, skipping')
+        savedFiles.extend(outputs)
+        return True
+    return False
+
+
+class HistDict(Mapping):
+    """
+    Read-only {name: histogram} mapping over a ROOT file.
+    A histogram is read from disk (and detached into gROOT) only when it is first accessed.
+    With prefetch, values() and items() read the next histograms in the background; a single
+    lookup reads only the requested histogram.
+    """
+    def __init__(self, histfile, names, tfile=None, prefetch=0):
+        self.histfile = histfile
+        self._names = list(names)
+        self._nameset = set(self._names)
+        self._hists = {}
+        self._file = tfile
+        self._prefetch = prefetch
+
+    def __getitem__(self, name):
+        if name in self._hists:
+            return self._hists[name]
+        if name not in self._nameset:
+            raise KeyError(name)
+        if self._file is None:
+            with SNDprofile.stage('open'):
+                self._file = openFile(self.histfile)
+        with SNDprofile.stage('read', name):
+            hist = self._file.Get(name)
+        with SNDprofile.stage('detach', name):
             hist.SetDirectory(ROOT.gROOT)
-        except:
-            print('### WARNING ###: key "'+str(key.GetName())+'" does not correspond to valid hist.')
+        hist.SetName(name)
+        self._hists[name] = hist
+        return hist
+
+    def __contains__(self, name):
+        return name in self._nameset
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def items(self):
+        if not self._prefetch:
+            for name in self._names: yield name, self[name]
+            return
+        # the whole mapping is iterated: the histograms not read yet are read ahead, in order
+        pending = [(self.histfile, n) for n in self._names if n not in self._hists]
+        prefetched = iter(SNDprefetch.Prefetcher(pending, self._prefetch))
+        for name in self._names:
+            if name not in self._hists:
+                # the prefetcher yields the pending names in the same order
+                path, hname, hist = next(prefetched)
+                if hist is None:
+                    print('### WARNING ###: Name "'+str(name)+'" does not correspond to valid hist.')
+                    continue
+                hist.SetDirectory(ROOT.gROOT)
+                hist.SetName(name)
+                self._hists[name] = hist
+            yield name, self._hists[name]
+
+    def values(self):
+        for name, hist in self.items(): yield hist
+
+    def close(self):
+        if self._file is not None:
+            closeFile(self._file)
+            self._file = None
+
+def load_hists(histfile, query=None, useindex=True, prefetch=0):
+    f = None
+    names = dict()
+    if useindex and SNDindex.isLocal(histfile):
+        # plan from the sidecar index: the file is only opened when a histogram is accessed
+        with SNDprofile.stage('index'):
+            entries = SNDindex.latestKeys(SNDindex.getIndex(histfile))
+        for name in (entries if query is None else dict.fromkeys(query)):
+            if name not in entries:
+                print('### WARNING ###: key "'+str(name)+'" not found in '+histfile+'.')
+            elif not entries[name]['ishist']:
+                print('### WARNING ###: key "'+str(name)+'" does not correspond to valid hist.')
+            else:
+                names[name] = None
+    else:
+        with SNDprofile.stage('open'):
+            f = openFile(histfile)
+        if query is not None:
+            # direct hashed lookups of the requested names, the rest of the file is never visited
+            keylist = list()
+            for name in dict.fromkeys(query):
+                key = f.GetKey(name)
+                if not key:
+                    print('### WARNING ###: key "'+str(name)+'" not found in '+histfile+'.')
+                    continue
+                keylist.append(key)
+        else:
+            keylist = f.GetListOfKeys()
+        for key in keylist:
+            # check if the key holds a histogram, without reading it
+            cl = ROOT.TClass.GetClass(key.GetClassName())
+            if not cl or not cl.InheritsFrom('TH1'):
+                print('### WARNING ###: key "'+str(key.GetName())+'" does not correspond to valid hist.')
+                continue
+            names[key.GetName()] = None
+    if len(names) == 0:
+        if f is not None: closeFile(f)
+        raise Exception('ERROR: histlist is empty!')
+    return HistDict(histfile, names, tfile=f, prefetch=prefetch)
+
+def listHists(histfile, useindex=True):
+    # names and classes of the drawable keys, in file order, without reading the objects
+    hinfo = {}
+    if useindex and SNDindex.isLocal(histfile):
+        for name, e in SNDindex.latestKeys(SNDindex.getIndex(histfile)).items():
+            hinfo[name] = e['class']
+    else:
+        f = ROOT.TFile.Open(histfile)
+        for key in f.GetListOfKeys():
+            hinfo[key.GetName()] = key.GetClassName()
+        f.Close()
+    return [(name, cname) for name, cname in hinfo.items() if 'TH1' in cname or 'TH2' in cname]
+
+def iterHists(histfile, names, prefetch=0):
+    """
+    Yields the histograms of histfile one at a time, each one is freed when the next is read.
+    With prefetch, the next ones are read in the background while the current one is drawn.
+    """
+    if prefetch:
+        for path, name, hist in SNDprefetch.Prefetcher([(histfile, name) for name in names], prefetch):
+            if hist is None:
+                print('### WARNING ###: Name "'+str(name)+'" does not correspond to valid hist.')
+                continue
+            ROOT.SetOwnership(hist, True)
+            hist.SetName(name)
+            yield hist
+            SNDtransform.clearTransforms(hist)
+        return
+    with SNDprofile.stage('open'):
+        f = openFile(histfile)
+    if not f or f.IsZombie(): raise Exception('ERROR: cannot open '+histfile)
+    try:
+        for name in names:
+            with SNDprofile.stage('read', name):
+                hist = f.Get(name)
+            if not hist:
+                print('### WARNING ###: Name "'+str(name)+'" does not correspond to valid hist.')
+                continue
+            with SNDprofile.stage('detach', name):
+                hist.SetDirectory(0)
+            ROOT.SetOwnership(hist, True)
+            hist.SetName(name)
+            yield hist
+            SNDtransform.clearTransforms(hist)
+    finally:
+        closeFile(f)
+
+def printIndex(histfile):
+    print(histfile)
+    for name, e in SNDindex.latestKeys(SNDindex.getIndex(histfile, details=True)).items():
+        nbins = str(e['nbinsx']) + ('x'+str(e['nbinsy']) if e['nbinsy'] else '')
+        print('  {:<40} {:<10} cycle {:<4} {:>12}  {}'.format(name, e['class'], e['cycle'], nbins, e['title']))
+
+class CanvasPool:
+    """
+    Canvases reused from one plot to the next, one per size and layout: get() returns it cleared,
+    which also deletes the copies, legends and text drawn for the previous plot.
+    The layout is None (single pad), (nx, ny) for a divided canvas or 'ratio' (see ratioPads):
+    the pads of a layout are created once and then only cleared.
+    """
+    def __init__(self):
+        self.canvases = {}
+
+    def get(self, width=800, height=600, layout=None):
+        key = (width, height, layout)
+        canvas = self.canvases.get(key)
+        if canvas is None:
+            name = 'cpool'+str(len(self.canvases))
+            canvas = ROOT.TCanvas(name, name, width, height)
+            if isinstance(layout, tuple): canvas.Divide(*layout)
+            self.canvases[key] = canvas
+        elif layout is None:
+            _resetPad(canvas)
+        else:
+            for obj in canvas.GetListOfPrimitives():
+                if obj.InheritsFrom('TPad'): _resetPad(obj)
+        canvas.cd()
+        return canvas
+
+    def close(self):
+        for canvas in self.canvases.values(): canvas.Close()
+        self.canvases = {}
+
+def _resetPad(pad):
+    pad.Clear()
+    pad.SetLogx(0)
+    pad.SetLogy(0)
+    pad.SetLogz(0)
+
+def _drawStream(histfile, names, extratext, outpath, opts1d, opts2d, pool, prefetch=0):
+    # reads, draws, saves and frees one histogram at a time
+    for hist in iterHists(histfile, names, prefetch):
+        canvas = pool.get(800, 600)
+        htype = hist.IsA().GetName()
+        if 'TH1' in htype:
+            _drawAuto1d(hist, canvas, extratext, outpath, opts1d)
+        elif 'TH2' in htype:
+            draw2dHisto(hist, canvas, extratext=extratext, outpath=outpath, **opts2d)
+        canvas.Clear()
+
+def renderStream(histfile, extratext='', outpath='', useindex=True, opts1d=None, opts2d=None, prefetch=0):
+    # auto-mode over a whole file with flat memory, whatever the number of histograms
+    if opts1d is None: opts1d = dict()
+    if opts2d is None: opts2d = dict()
+    hinfo = listHists(histfile, useindex=useindex)
+    if len(hinfo) == 0: raise Exception('ERROR: histlist is empty!')
+    start = time.time()
+    pool = CanvasPool()
+    try:
+        _drawStream(histfile, [hname for hname, cname in hinfo], extratext, outpath, opts1d, opts2d, pool, prefetch)
+    finally:
+        pool.close()
+    print('{} plots in {:.1f} s'.format(len(hinfo), time.time()-start))
+
+def _renderShare(task):
+    # worker of renderParallel: opens the file on its own and draws its share of histograms
+    histfile, share, extratext, outpath, opts1d, opts2d = task
+    start = time.time()
+    # the profile of the parent is not counted again
+    SNDprofile.reset()
+    ROOT.gROOT.SetBatch(True)
+    init_style()
+    pool = CanvasPool()
+    _drawStream(histfile, [hname for i_h, hname in share], extratext, outpath, opts1d, opts2d, pool)
+    pool.close()
+    updated = _manifest.updated if _manifest is not None else {}
+    return os.getpid(), len(share), time.time()-start, updated, SNDprofile.collect()
+
+def _latestStamps(f):
+    # {name: (cycle, datime)} of the newest cycle of each drawable key
+    stamps = {}
+    for key in f.GetListOfKeys():
+        cname = key.GetClassName()
+        if not ('TH1' in cname or 'TH2' in cname): continue
+        stamp = (key.GetCycle(), key.GetDatime().Get())
+        if stamp > stamps.get(key.GetName(), (-1, 0)):
+            stamps[key.GetName()] = stamp
+    return stamps
+
+def watch(histfile, interval=0.5, extratext='', outpath='', opts1d=None, opts2d=None, names=None):
+    # redraws the histograms of a file being written (e.g. by the online monitoring) as soon as they change,
+    # only those of names if given
+    if opts1d is None: opts1d = dict()
+    if opts2d is None: opts2d = dict()
+    global _openFiles
+    if _openFiles is None: _openFiles = dict()
+    canvas = ROOT.TCanvas("cwatch", "cwatch", 800, 600)
+    drawn = {}
+    stamps = {}
+    laststat = None
+    print('Watching', histfile, 'every', interval, 's, Ctrl-C to stop')
+    try:
+        while True:
+            st = os.stat(histfile)
+            if (st.st_size, st.st_mtime) == laststat:
+                time.sleep(interval)
+                continue
+            start = time.time()
+            f = openFile(histfile)
+            if not f or f.IsZombie():
+                # file being (re)written, try again at the next poll
+                cached = _openFiles.pop(histfile, None)
+                if cached is not None and cached[2]: cached[2].Close()
+                time.sleep(interval)
+                continue
+            laststat = (st.st_size, st.st_mtime)
+            newstamps = _latestStamps(f)
+            if names is not None: newstamps = {name: newstamps[name] for name in names if name in newstamps}
+            changed = [name for name, stamp in newstamps.items() if stamps.get(name) != stamp]
+            if changed:
+                hists = load_hists(histfile, query=changed, useindex=False)
+                nplots = 0
+                for name in changed:
+                    try:
+                        hist = hists[name]
+                    except Exception:
+                        print('### WARNING ###: "'+name+'" could not be read, retrying at the next poll.')
+                        laststat = None
+                        continue
+                    if 'TH1' in hist.IsA().GetName():
+                        _drawAuto1d(hist, canvas, extratext, outpath, opts1d)
+                    else:
+                        draw2dHisto(hist, canvas, extratext=extratext, outpath=outpath, **opts2d)
+                    # the previous version is no more needed
+                    if name in drawn:
+                        SNDtransform.clearTransforms(drawn[name])
+                        drawn[name].Delete()
+                    drawn[name] = hist
+                    stamps[name] = newstamps[name]
+                    nplots += 1
+                print('{}: {} plots updated in {:.2f} s'.format(time.strftime('%H:%M:%S'), nplots, time.time()-start))
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+def pairDataMC(names):
+    # DATA<x> histograms paired with MC<x>, the naming convention of drawDATAMC
+    nameset = set(names)
+    pairs = list()
+    for name in names:
+        if 'DATA' in name and name.replace('DATA', 'MC', 1) in nameset:
+            pairs.append((name, name.replace('DATA', 'MC', 1)))
+    return pairs
+
+def scanDataMC(histfile, top=10, outpath='', extratext='', useindex=True):
+    """
+    Compares all the DATA/MC pairs of histfile (chi2/ndf and Kolmogorov test of the normalized shapes),
+    writes the ranked report to <outpath>compatibility.csv/.json and draws the top worst pairs.
+    """
+    import csv
+    import json
+    np = SNDstats.numpy()
+    if np is None: raise Exception('ERROR: the DATA-MC scan requires numpy!')
+    hists = load_hists(histfile, useindex=useindex)
+    # pairs with the same number of bins are compared in one vectorized batch
+    groups = {}
+    for dname, mname in pairDataMC(list(hists)):
+        dhist, mhist = hists[dname], hists[mname]
+        nbins = dhist.GetNbinsX()
+        dcontent, mcontent = SNDstats.contentView(dhist), SNDstats.contentView(mhist)
+        if dhist.GetDimension() != 1 or mhist.GetNbinsX() != nbins or dcontent is None or mcontent is None:
+            print('### WARNING ###: '+dname+' and '+mname+' cannot be compared, skipping.')
             continue
-        hist.SetName(key.GetName())
-        histlist[key.GetName()] = hist
-    if len(histlist) == 0: raise Exception('ERROR: histlist is empty!')
-    f.Close()
-    return histlist
+        groups.setdefault(nbins, []).append((dname, mname,
+            np.array(dcontent[1:nbins+1], dtype='f8'), np.array(SNDstats.sumw2View(dhist)[1:nbins+1]),
+            np.array(mcontent[1:nbins+1], dtype='f8'), np.array(SNDstats.sumw2View(mhist)[1:nbins+1])))
+    rows = list()
+    for nbins, group in groups.items():
+        result = SNDstats.compatibility(*[np.array([g[i] for g in group]) for i in range(2, 6)])
+        for i, g in enumerate(group):
+            rows.append({'data': g[0], 'mc': g[1], 'nbins': nbins, 'chi2': float(result['chi2'][i]),
+                         'ndf': int(result['ndf'][i]), 'chi2ndf': float(result['chi2ndf'][i]),
+                         'ks': float(result['ks'][i]), 'ksprob': float(result['ksprob'][i])})
+    if len(rows) == 0: raise Exception('ERROR: no DATA-MC pairs found!')
+    # worst first
+    rows.sort(key=lambda row: (-row['chi2ndf'], row['ksprob']))
+    with open(outpath+'compatibility.csv', 'w') as fout:
+        writer = csv.DictWriter(fout, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(outpath+'compatibility.json', 'w') as fout:
+        json.dump(rows, fout, indent=1)
+    savedFiles.extend([outpath+'compatibility.csv', outpath+'compatibility.json'])
+    print('{:<40} {:>10} {:>10}'.format('DATA histogram', 'chi2/ndf', 'KS prob'))
+    for row in rows[:top]:
+        print('{:<40} {:>10.3g} {:>10.3g}'.format(row['data'], row['chi2ndf'], row['ksprob']))
+    canvas = ROOT.TCanvas("cscan", "cscan", 800, 800)
+    for row in rows[:top]:
+        dhist = hists[row['data']]
+        drawDATAMC([dhist, hists[row['mc']]], canvas, figname=row['data'].replace('DATA', 'DATA-MC', 1),
+                   xaxtitle=dhist.GetXaxis().GetTitle(), yaxtitle='a.u.', normalize=True,
+                   extra_text=extratext, outpath=outpath, ratio='ratio')
+    return rows
+
+def renderParallel(histfile, jobs, extratext='', outpath='', useindex=True, opts1d=None, opts2d=None):
+    # same output as the serial auto loop, histograms are dealt round-robin to the workers
+    if opts1d is None: opts1d = dict()
+    if opts2d is None: opts2d = dict()
+    hinfo = listHists(histfile, useindex=useindex)
+    if len(hinfo) == 0: raise Exception('ERROR: histlist is empty!')
+    indexed = [(i_h, hname) for i_h, (hname, cname) in enumerate(hinfo)]
+    jobs = min(jobs, len(indexed))
+    tasks = [(histfile, indexed[i::jobs], extratext, outpath, opts1d, opts2d) for i in range(jobs)]
+    start = time.time()
+    import multiprocessing
+    pool = multiprocessing.get_context('fork').Pool(jobs)
+    try:
+        results = pool.map(_renderShare, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    for pid, nplots, elapsed, updated, profile in results:
+        if _manifest is not None: _manifest.entries.update(updated)
+        SNDprofile.merge(profile)
+        print('Worker {}: {} plots in {:.1f} s ({:.2f} plots/s)'.format(pid, nplots, elapsed, nplots/elapsed if elapsed > 0 else 0.))
+    elapsed = time.time()-start
+    print('Total: {} plots in {:.1f} s ({:.2f} plots/s) with {} workers'.format(len(indexed), elapsed, len(indexed)/elapsed, jobs))
 
-def getHistFromfiles(filelist, hname, labellist):
+def getHistFromfiles(filelist, hname, labellist, useindex=True, prefetch=0):
     histlist = {}
-    if len(file_list) != len(labellist): raise Exception('N. of files and labels mismatches!')
-    for i_file, f in enumerate(file_list):
-        fin = ROOT.TFile.Open(f)
-        hist = fin.Get(hname)
-        try:
+    if len(filelist) != len(labellist): raise Exception('N. of files and labels mismatches!')
+    files = list()
+    for i_file, f in enumerate(filelist):
+        if useindex and SNDindex.isLocal(f):
+            # skip files without the histogram before opening them
+            entry = SNDindex.latestKeys(SNDindex.getIndex(f)).get(hname)
+            if entry is None or not entry['ishist']:
+                print('### WARNING ###: Name "'+str(hname)+'" does not correspond to valid hist in '+f+'.')
+                continue
+        files.append((i_file, f))
+    if prefetch:
+        # up to prefetch files are read at the same time
+        reader = SNDprefetch.Prefetcher([(f, hname) for i_file, f in files], prefetch, workers=prefetch)
+        for (i_file, f), (path, name, hist) in zip(files, reader):
+            if hist is None or not hist.InheritsFrom('TH1'):
+                print('### WARNING ###: Name "'+str(hname)+'" does not correspond to valid hist.')
+                continue
             hist.SetDirectory(ROOT.gROOT)
-        except:
-            print('### WARNING ###: Name "'+str(hname)+'" does not correspond to valid hist.')
-            continue
-        hist.SetName(labellist[i_file]+'_'+hname)
-        histlist[labellist[i_file]+'_'+hname] = hist
-        fin.Close()
+            hist.SetName(labellist[i_file]+'_'+hname)
+            histlist[labellist[i_file]+'_'+hname] = hist
+    else:
+        for i_file, f in files:
+            name = labellist[i_file]+'_'+hname
+            with SNDprofile.stage('open', name):
+                fin = openFile(f)
+            with SNDprofile.stage('read', name):
+                hist = fin.Get(hname)
+            try:
+                with SNDprofile.stage('detach', name):
+                    hist.SetDirectory(ROOT.gROOT)
+            except:
+                print('### WARNING ###: Name "'+str(hname)+'" does not correspond to valid hist.')
+                closeFile(fin)
+                continue
+            hist.SetName(name)
+            histlist[name] = hist
+            with SNDprofile.stage('close', name):
+                closeFile(fin)
     if len(histlist) == 0: raise Exception('ERROR: histlist is empty!')
     return histlist
-    
 
-def createCanvas(noPlots):
-    if noPlots == 1:
-        xPad = 1; yPad = 1; width = 550; height = 0.90*width
-    elif noPlots == 2:
-        xPad = 2; yPad = 1; width = 600; height = 0.50*width
-    elif noPlots == 3:
-        xPad = 3; yPad = 1; width = 900; height = 0.4*width
-    elif noPlots == 4:
-        xPad = 2; yPad = 2; width = 600; height = width
+def _readHists(path, hnames, functions=None):
+    # reads and detaches the requested histograms of one file, returns {hname: hist}.
+    # functions are the (open, get) of SNDprefetch.reader, which do not hold the GIL
+    if functions is None: functions = (ROOT.TFile.Open, lambda f, name: f.Get(name))
+    fopen, get = functions
+    fin = fopen(path)
+    hists = {}
+    if not fin or fin.IsZombie():
+        print('### WARNING ###: cannot open '+path+', skipping.')
+        return hists
+    ROOT.SetOwnership(fin, True)
+    for hname in hnames:
+        hist = get(fin, hname)
+        if not hist or not hist.InheritsFrom('TH1'):
+            print('### WARNING ###: Name "'+str(hname)+'" does not correspond to valid hist in '+path+'.')
+            continue
+        hist.SetDirectory(0)
+        ROOT.SetOwnership(hist, True)
+        hists[hname] = hist
+    fin.Close()
+    return hists
+
+def mergeHistFromfiles(filelist, hnames, threads=0):
+    """
+    Sums each histogram of hnames over all the files of filelist (as hadd does).
+    Only one running sum per histogram is kept in memory; with threads > 0 the files are
+    read by a pool of threads, at most 2*threads files ahead of the summation, without the GIL.
+    Histograms with a binning different from the first one are skipped.
+    """
+    merged = {}
+    def accumulate(path, hists):
+        for hname, hist in hists.items():
+            if hname not in merged:
+                hist.SetDirectory(ROOT.gROOT)
+                ROOT.SetOwnership(hist, False)
+                merged[hname] = hist
+            elif not SNDstats.sameBinning(merged[hname], hist):
+                print('### WARNING ###: "'+hname+'" of '+path+' has a different binning, skipping.')
+            else:
+                merged[hname].Add(hist)
+    if threads > 0:
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+        ROOT.EnableThreadSafety()
+        functions = SNDprefetch.reader()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            pending = deque()
+            for path in filelist:
+                pending.append((path, pool.submit(_readHists, path, hnames, functions)))
+                if len(pending) >= 2*threads:
+                    path, future = pending.popleft()
+                    accumulate(path, future.result())
+            while pending:
+                path, future = pending.popleft()
+                accumulate(path, future.result())
+    else:
+        for path in filelist:
+            accumulate(path, _readHists(path, hnames))
+    if len(merged) == 0: raise Exception('ERROR: histlist is empty!')
+    # same order as requested
+    return {hname: merged[hname] for hname in hnames if hname in merged}
+
+
+# size in pixels of a pad of a page, when the page size is not given
+PADSIZE = (400, 330)
+
+def pageGrid(nplots=None, grid=None, pagesize=None):
+    """
+    (nx, ny, width, height) of the pages: the grid of pads is given, or as many pads of PADSIZE
+    as fit in pagesize, or 3x2; it is shrunk when fewer plots than pads are drawn.
+    """
+    if grid:
+        nx, ny = grid
+    elif pagesize:
+        nx, ny = max(1, pagesize[0]//PADSIZE[0]), max(1, pagesize[1]//PADSIZE[1])
     else:
-        xPad = 3; yPad = 2; width = 800; height = 0.55*width
-    noPadPerCanv = xPad * yPad
-    nCanvases = int(noPlots/6)+1
-    canvs = {}
-    for i in range(nCanvases):
-        #canvs['canv'+str(i)] = ROOT.TCanvas("canv"+str(i), "Variables", int(width), int(height))
-        canvs['canv'+str(i)] = ROOT.TCanvas("canv"+str(i), "Variables", 1000, int(0.55*1000/0.55))
-        canvs['canv'+str(i)].Divide(xPad, yPad)
-    #canv = ROOT.TCanvas("canv", "Variables", int(width), int(height))
-    #canv = ROOT.TCanvas("canv", "Variables", 1200, int(0.55*1200))
-    return canvs
+        nx, ny = 3, 2
+    if nplots:
+        # smallest grid holding all the plots, one row first
+        while ny > 1 and nx*(ny-1) >= nplots: ny -= 1
+        while nx > 1 and (nx-1)*ny >= nplots: nx -= 1
+    width, height = pagesize if pagesize else (nx*PADSIZE[0], ny*PADSIZE[1])
+    return nx, ny, int(width), int(height)
+
+def drawPages(hists, figname='canvas', outpath='', nplots=None, grid=None, pagesize=None,
+              contents=True, pool=None, draw1d=None, draw2d=None):
+    """
+    Packs the 1D and 2D histograms of hists, any iterable (e.g. iterHists), into pages of nx x ny pads,
+    saved as <figname>_<n> as soon as they are full: only one page of plots is in memory at a time.
+    draw1d and draw2d are passed to drawSingleHisto and draw2dHisto. With contents, a list of the
+    plots of each page is written after the pages, as <figname>_contents.
+    """
+    if nplots is None and hasattr(hists, '__len__'): nplots = len(hists)
+    nx, ny, width, height = pageGrid(nplots, grid, pagesize)
+    if pool is None: pool = CanvasPool()
+    if draw1d is None: draw1d = dict()
+    if draw2d is None: draw2d = dict()
+    pages = list()
+    page = None
+    for hist in hists:
+        if page is None or len(pages[-1]) == nx*ny:
+            if page is not None: saveCanvas(page, outpath+figname+'_'+str(len(pages)-1))
+            # the pads of the previous page, and the copies drawn in them, are cleared here
+            page = pool.get(width, height, layout=(nx, ny))
+            pages.append(list())
+        pad = page.cd(len(pages[-1])+1)
+        if 'TH2' in hist.IsA().GetName():
+            draw2dHisto(hist, pad, formats=(), **draw2d)
+        else:
+            drawSingleHisto(hist, pad, formats=(), **draw1d)
+        pages[-1].append(hist.GetName())
+    if page is None: raise Exception('ERROR: histlist is empty!')
+    saveCanvas(page, outpath+figname+'_'+str(len(pages)-1))
+    if contents: _contentsPages(pages, figname, outpath, width, height, pool)
+    return pages
 
+def _contentsPages(pages, figname, outpath, width, height, pool, perpage=40):
+    # the pages are streamed out, so the contents come last
+    lines = list()
+    for i, names in enumerate(pages):
+        line = figname+'_'+str(i)+': '+', '.join(names)
+        lines.append(line if len(line) < 120 else line[:117]+'...')
+    for first in range(0, len(lines), perpage):
+        canvas = pool.get(width, height)
+        text = ROOT.TPaveText(0.05, 0.05, 0.95, 0.95, 'NDC')
+        text.SetFillColor(ROOT.kWhite)
+        text.SetBorderSize(0)
+        text.SetTextAlign(12)
+        text.SetTextFont(42)
+        text.AddText('Contents')
+        for line in lines[first:first+perpage]: text.AddText(line)
+        # owned and deleted by the canvas
+        ROOT.SetOwnership(text, False)
+        text.SetBit(ROOT.kCanDelete)
+        text.Draw()
+        suffix = '_'+str(first//perpage) if len(lines) > perpage else ''
+        saveCanvas(canvas, outpath+figname+'_contents'+suffix)
+
+@SNDprofile.profiled
 def drawSingleHisto(hist, canvas=None, xaxtitle=None, yaxtitle=None, 
             label='auto', color=None, logy=False, drawoptions='',
 	        extratext=None,topmargin=None, bottommargin=None,
 	        leftmargin=None, rightmargin=None,
-	        xaxlabelfont=None, xaxlabelsize=None, outpath='', rebin=None, sigma=list(), scale=1., xaxrange=None, yaxrange=None):
+	        xaxlabelfont=None, xaxlabelsize=None, outpath='', rebin=None, sigma=list(), scale=1., xaxrange=None, yaxrange=None, formats=None, rangestats=False, adaptive=None,
+	        normalize=False, figname=None):
+
+    if figname is None: figname = hist.GetName()
+    if _skipUnchanged(outpath+figname, [hist], locals()): return
 
     if not canvas:
         canvas = ROOT.TCanvas("c", "c", 800, 600)
 
     if color is None: color = ROOT.kAzure-4
 
-    if xaxlabelfont is None: xaxlabelfont = 4 
-    if xaxlabelsize is None: xaxlabelsize = 15
-    yaxlabelfont = 4; yaxlabelsize = 15
-    axtitlefont = 6; axtitlesize = 18
     legendfont = 5
     if leftmargin is None: leftmargin = 0.15
     if rightmargin is None: rightmargin = 0.05
     if topmargin is None: topmargin = 0.05
     if bottommargin is None: bottommargin = 0.15
-    canvas.SetBottomMargin(bottommargin)
-    canvas.SetLeftMargin(leftmargin)
-    canvas.SetRightMargin(rightmargin)
-    canvas.SetTopMargin(topmargin)
 
     pentryheight = 0.12
     plegendbox = ([leftmargin+0.30,1-topmargin-pentryheight-0.01, 1-rightmargin-0.03,1-topmargin-0.03])
+
+    # the loaded histogram is left untouched, the plot is made on a copy
+    with SNDprofile.stage('transform'):
+        hist = SNDtransform.drawCopy(SNDtransform.prepare([hist], rebin, adaptive, scale, normalize)[0])
+    # fonts, sizes, offsets and divisions of the axes come with the style
+    with SNDprofile.stage('style'):
+        useStyle('SND-single', canvas)
+        styleAxes(hist)
+        canvas.SetMargin(leftmargin, rightmargin, bottommargin, topmargin)
     hist.SetLineColor(color)
     hist.SetLineWidth(2)
-
-    if rebin is not None:
-        hist.Rebin(int(hist.GetNbinsX()/rebin))
-
-    if scale !=1.:
-        hist.Scale(scale)
     
     if label is not None:
         leg = ROOT.TLegend(plegendbox[0],plegendbox[1],plegendbox[2],plegendbox[3])
@@ -147,106 +910,121 @@ def drawSingleHisto(hist, canvas=None, xaxtitle=None, yaxtitle=None,
             if label=='':
                 label = hist.GetName()
         leg.AddEntry(hist,label,"l")
-        leg.AddEntry(0, 'Entries: {:.2e}'.format(hist.GetEntries()), '')
-        leg.AddEntry(0, 'Integral: {:.2e}'.format(hist.Integral()), '')
-        leg.AddEntry(0, 'Mean: {:.2e}'.format(hist.GetMean()), '')
-        leg.AddEntry(0, 'Std dev: {:.2e}'.format(hist.GetStdDev()), '')
+        stats = SNDstats.histStats(hist, xaxrange if rangestats else None)
+        leg.AddEntry(0, 'Entries: {:.2e}'.format(stats['entries']), '')
+        leg.AddEntry(0, 'Integral: {:.2e}'.format(stats['integral']), '')
+        leg.AddEntry(0, 'Mean: {:.2e}'.format(stats['mean']), '')
+        leg.AddEntry(0, 'Std dev: {:.2e}'.format(stats['stddev']), '')
         #leg.AddEntry(0,'#sigma: {:.2e}'.format(sigma[0]), '')
         #leg.AddEntry(0,'#sigma error: {:.2e}'.format(sigma[1]), '')
 
     xax = hist.GetXaxis()
     #xax.SetNdivisions(5,4,0,ROOT.kTRUE)
-    xax.SetLabelFont(10*xaxlabelfont+3)
-    xax.SetLabelSize(xaxlabelsize)
+    if xaxlabelfont is not None: xax.SetLabelFont(10*xaxlabelfont+3)
+    if xaxlabelsize is not None: xax.SetLabelSize(xaxlabelsize)
     if xaxtitle is not None:
         xax.SetTitle(xaxtitle)
-    xax.SetTitleFont(10*axtitlefont+3)
-    xax.SetTitleSize(axtitlesize)
-    xax.SetTitleOffset(1.2)
     xax.CenterTitle(True)
     if xaxrange:
         xax.SetRangeUser(float(xaxrange[0]), float(xaxrange[1]))
     if not logy:
         hist.SetMaximum(hist.GetMaximum()*1.35)
         hist.SetMinimum(0.)
+        canvas.SetLogy(0)
     else:
         hist.SetMaximum(hist.GetMaximum()*100)
         #hist.SetMinimum(hist.GetMaximum()/1e7)
         canvas.SetLogy()
     yax = hist.GetYaxis()
     yax.SetMaxDigits(3)
-    yax.SetNdivisions(8,4,0,ROOT.kTRUE)
-    yax.SetLabelFont(10*yaxlabelfont+3)
-    yax.SetLabelSize(yaxlabelsize)
     if yaxtitle is not None: 
         yax.SetTitle(yaxtitle)
-    yax.SetTitleFont(10*axtitlefont+3)
-    yax.SetTitleSize(axtitlesize)
-    yax.SetTitleOffset(1.5)
     yax.CenterTitle(True)
     if yaxrange:yax.SetRangeUser(float(yaxrange[0]), float(yaxrange[1]))
     
-    hist.Draw(drawoptions)
-    ROOT.gPad.RedrawAxis()
-    writeSND(canvas, extratext=extratext)
+    with SNDprofile.stage('Draw'):
+        hist.Draw(drawoptions)
+        ROOT.gPad.RedrawAxis()
+    with SNDprofile.stage('writeSND'):
+        writeSND(canvas, extratext=extratext)
     if label is not None: leg.DrawClone("same")
-    ROOT.gPad.Update()
-    canvas.Draw()
-    canvas.SaveAs(outpath+hist.GetName()+'.pdf', 'pdf')
+    saveCanvas(canvas, outpath+figname, formats)
 
+def drawVariants(hist, canvas=None, outpath='', **kwargs):
+    # linear and log, raw and normalized plots of hist: one read, the rebinning is done once
+    for normalize in (False, True):
+        for logy in (False, True):
+            figname = hist.GetName()+('_norm' if normalize else '')+('_log' if logy else '_lin')
+            drawSingleHisto(hist, canvas, logy=logy, normalize=normalize, figname=figname, outpath=outpath, **kwargs)
 
+def _drawAuto1d(hist, canvas, extratext, outpath, opts1d):
+    # 1D histograms in auto-mode, in the four variants with --variants
+    opts1d = dict(opts1d)
+    if opts1d.pop('variants', False):
+        drawVariants(hist, canvas, drawoptions='HIST', extratext=extratext, outpath=outpath, **opts1d)
+    else:
+        drawSingleHisto(hist, canvas, drawoptions='HIST', extratext=extratext, logy=True, outpath=outpath, **opts1d)
+
+
+@SNDprofile.profiled
 def drawDATAMC(histlist, c1=None, figname='DATA-MC', xaxtitle=None, yaxtitle=None,
-	    normalize=False, lumi=None, dolegend=True, labellist=None, logy=False, extra_text = '', rebin=None, outpath='.', xaxrange=[]):
+	    normalize=False, lumi=None, dolegend=True, labellist=None, logy=False, extra_text = '', rebin=None, outpath='.', xaxrange=[], formats=None, rangestats=False,
+	    ratio=None, ratiofrac=0.3, adaptive=None):
+
+    if _skipUnchanged(outpath+figname, histlist, locals()): return
 
     if not c1:
         c1 = ROOT.TCanvas()
     
-    xaxlabelfont = 4 
-    xaxlabelsize = 22
-    yaxlabelfont = 4; yaxlabelsize = 22
-    axtitlefont = 6; axtitlesize = 26
+    axtitlesize = 26
     legendfont = 5
     leftmargin = 0.15
     rightmargin = 0.05
     topmargin = 0.05
     bottommargin = 0.15
-    c1.SetBottomMargin(bottommargin)
-    c1.SetLeftMargin(leftmargin)
-    c1.SetRightMargin(rightmargin)
-    c1.SetTopMargin(topmargin)
+    # fonts, sizes and margins of the SND-multi style
+    with SNDprofile.stage('style'):
+        useStyle('SND-multi', c1)
 
+    # with ratio='ratio' or 'pull' the histograms are drawn in the upper pad, the ratio in the lower one
+    if ratio and not any('DATA' in h.GetName() for h in histlist):
+        print('No DATA histogram, the', ratio, 'panel is not drawn')
+        ratio = None
+    pad = c1
+    if ratio:
+        pad, lowerpad = ratioPads(c1, ratiofrac, leftmargin, rightmargin, topmargin, bottommargin)
 
     pentryheight = 0.06
     nentries = 1 + len(histlist)
     if nentries>3: pentryheight = pentryheight*0.8
     plegendbox = ([leftmargin+0.45,1-topmargin-pentryheight*nentries, 1-rightmargin-0.03,1-topmargin-0.03])
     
-    if rebin is not None:
-        for hist in histlist:
-            hist.Rebin(int(hist.GetNbinsX()/rebin))
+    # the loaded histograms are left untouched, the plot is made on transformed copies
+    with SNDprofile.stage('transform'):
+        histlist = SNDtransform.prepare(histlist, rebin, adaptive)
 
     pairs = list()
-    for hist in histlist:
-        hist.SetStats(0)
-        pairs.append([hist.GetMaximum(), hist])
+    for i, hist in enumerate(histlist):
+        pairs.append([hist.GetMaximum(), i])
     maxpair = max(pairs,key=lambda item:item[0])
 
 
-    if normalize:
-        for hist in histlist:
-            if hist.Integral() == 0: 
+    if normalize or lumi:
+        for hist, stats in zip(histlist, SNDstats.batchStats(histlist)):
+            if stats['integral'] == 0: 
                 print(hist.GetName(), 'has null integral, skipping')
                 return            
-            hist.Scale(1./hist.Integral())
-    elif lumi:
+    with SNDprofile.stage('transform'):
+        if normalize:
+            histlist = [SNDtransform.transform(hist, ('normalize',)) for hist in histlist]
+        elif lumi:
+            histlist = [hist if 'DATA' in hist.GetName() else SNDtransform.transform(hist, ('scale', lumi)) for hist in histlist]
+        histlist = [SNDtransform.drawCopy(hist) for hist in histlist]
+    with SNDprofile.stage('style'):
         for hist in histlist:
-            if hist.Integral() == 0: 
-                print(hist.GetName(), 'has null integral, skipping')
-                return  
-            if not 'DATA' in hist.GetName():
-                hist.Scale(lumi)
-            else:
-                hist.Scale(1.)
+            styleAxes(hist)
+            hist.SetStats(0)
+    maxpair[1] = histlist[maxpair[1]]
     
     if not logy:
         maxpair[1].SetMaximum(maxpair[1].GetMaximum()*1.2)
@@ -257,7 +1035,7 @@ def drawDATAMC(histlist, c1=None, figname='DATA-MC', xaxtitle=None, yaxtitle=Non
         maxpair[1].SetMaximum(maxpair[1].GetMaximum()*10)
         for h in histlist:
             h.SetMaximum(maxpair[1].GetMaximum()*10)
-        c1.SetLogy()
+        pad.SetLogy()
         
     data_index = -1
     for i, h in enumerate(histlist):
@@ -279,6 +1057,7 @@ def drawDATAMC(histlist, c1=None, figname='DATA-MC', xaxtitle=None, yaxtitle=Non
     legend.SetFillColor(ROOT.kWhite)
     legend.SetTextFont(10*legendfont+3)
     legend.SetBorderSize(0)
+    statslist = SNDstats.batchStats(histlist, xaxrange if rangestats else None)
     for i,hist in enumerate(histlist):
         label = hist.GetTitle()
         if labellist is not None: label = labellist[i]
@@ -290,73 +1069,111 @@ def drawDATAMC(histlist, c1=None, figname='DATA-MC', xaxtitle=None, yaxtitle=Non
                     legend.AddEntry(hist, 'Data', "PEL")
             else:
                 legend.AddEntry(hist, 'Background', "FEL")
-        legend.AddEntry(hist, 'Integral: {:.2e}'.format(hist.Integral()), '')
-        legend.AddEntry(hist, 'Mean: {:.2e}'.format(hist.GetMean()), '')
+        legend.AddEntry(hist, 'Integral: {:.2e}'.format(statslist[i]['integral']), '')
+        legend.AddEntry(hist, 'Mean: {:.2e}'.format(statslist[i]['mean']), '')
     
     for h in histlist:
         xax = h.GetXaxis()
-        xax.SetLabelSize(xaxlabelsize)
-        xax.SetLabelFont(10*xaxlabelfont+3)
         if xaxtitle is not None:
             xax.SetTitle(xaxtitle)
-        xax.SetTitleFont(10*axtitlefont+3)
-        xax.SetTitleSize(axtitlesize)
-        xax.SetTitleOffset(1.2)
         if xaxrange:
             xax.SetRangeUser(xaxrange[0], xaxrange[1])
+        if ratio:
+            # the x axis is drawn below the ratio
+            xax.SetLabelSize(0)
+            xax.SetTitleSize(0)
         # Y-axis layout
         yax = h.GetYaxis()
         yax.SetMaxDigits(3)
-        yax.SetLabelFont(10*yaxlabelfont+3)
-        yax.SetLabelSize(yaxlabelsize)
         if yaxtitle is not None:
             yax.SetTitle(yaxtitle)
-        yax.SetTitleFont(10*axtitlefont+3)
-        yax.SetTitleSize(axtitlesize)
-        yax.SetTitleOffset(1.2)
         yax.CenterTitle(True)
         hist.SetMaximum(maxpair[1].GetMaximum()*1.2)
 
-    for i in range(len(histlist)):
-        drawopt = ''
-        if i!= data_index:
-            if histlist[i].GetEntries() < 20: drawopt = 'E'
-            histlist[i].Draw("HIST SAME "+drawopt)
-    histlist[data_index].Draw("* SAME")
+    pad.cd()
+    with SNDprofile.stage('Draw'):
+        for i in range(len(histlist)):
+            drawopt = ''
+            if i!= data_index:
+                if histlist[i].GetEntries() < 20: drawopt = 'E'
+                histlist[i].Draw("HIST SAME "+drawopt)
+        histlist[data_index].Draw("* SAME")
+        ROOT.gPad.RedrawAxis()
     
     
-    ROOT.gPad.RedrawAxis()
-    writeSND(c1, extratext=extra_text)
+    with SNDprofile.stage('writeSND'):
+        writeSND(pad, extratext=extra_text)
     if dolegend: legend.DrawClone("same")
-    ROOT.gPad.Update()
-    c1.Draw()
-    c1.SaveAs(outpath+figname+'.pdf', 'pdf')
+    if ratio:
+        lowerpad.cd()
+        rhist, defined = SNDstats.ratioHist(histlist[data_index], [h for i, h in enumerate(histlist) if i != data_index], ratio)
+        rhist.SetMaximum(2. if ratio == 'ratio' else 5.)
+        rhist.SetMinimum(0. if ratio == 'ratio' else -5.)
+        xax = rhist.GetXaxis()
+        # the axes only: the markers are those of the data
+        xax.ResetAttAxis('X')
+        xax.SetTitle(histlist[data_index].GetXaxis().GetTitle())
+        xax.SetTitleSize(axtitlesize)
+        # pixel fonts: title size and offset do not scale with the pad height, the lower margin holds the title
+        xax.SetTitleOffset(1.2)
+        xax.SetTickLength(xax.GetTickLength()*(1-ratiofrac)/ratiofrac)
+        if xaxrange:
+            xax.SetRangeUser(xaxrange[0], xaxrange[1])
+        yax = rhist.GetYaxis()
+        yax.ResetAttAxis('Y')
+        yax.SetNdivisions(505)
+        yax.SetTitle('Data/MC' if ratio == 'ratio' else 'Pull')
+        yax.CenterTitle(True)
+        if ratio == 'ratio':
+            # the bins without MC have no ratio: only the defined ones are drawn, not as a ratio of 0
+            rhist.Draw('AXIS')
+            points = SNDstats.ratioGraph(rhist, defined)
+            ROOT.SetOwnership(points, False)
+            points.SetBit(ROOT.kCanDelete)
+            points.Draw('P')
+        else:
+            rhist.Draw('HIST')
+        line = ROOT.TLine(xax.GetBinLowEdge(xax.GetFirst()), 1. if ratio == 'ratio' else 0.,
+                          xax.GetBinUpEdge(xax.GetLast()), 1. if ratio == 'ratio' else 0.)
+        line.SetLineStyle(2)
+        line.DrawClone()
+        c1.cd()
+    saveCanvas(c1, outpath+figname, formats)
 
+@SNDprofile.profiled
 def draw2dHisto(hist, canvas=None,xaxtitle=None, yaxtitle=None, 
             label=None, drawoptions='COLZ',
 	        extratext=None,topmargin=None, bottommargin=None,
 	        leftmargin=None, rightmargin=None,
-	        xaxlabelfont=None, xaxlabelsize=None, outpath=''):
+	        xaxlabelfont=None, xaxlabelsize=None, outpath='', formats=None,
+	        downsample=None, raster=False):
+
+    if _skipUnchanged(outpath+hist.GetName(), [hist], locals()): return
 
     if not canvas:
         canvas = ROOT.TCanvas()
 
-    if xaxlabelfont is None: xaxlabelfont = 4 
-    if xaxlabelsize is None: xaxlabelsize = 22
-    yaxlabelfont = 4; yaxlabelsize = 22
-    axtitlefont = 6; axtitlesize = 26
     legendfont = 5
     if leftmargin is None: leftmargin = 0.15
     if rightmargin is None: rightmargin = 0.05
     if topmargin is None: topmargin = 0.05
     if bottommargin is None: bottommargin = 0.15
-    canvas.SetBottomMargin(bottommargin)
-    canvas.SetLeftMargin(leftmargin)
-    canvas.SetRightMargin(rightmargin)
-    canvas.SetTopMargin(topmargin)
+    with SNDprofile.stage('style'):
+        useStyle('SND-2D', canvas)
+        canvas.SetMargin(leftmargin, rightmargin, bottommargin, topmargin)
 
     pentryheight = 0.15
     plegendbox = ([leftmargin+0.45,1-topmargin-pentryheight, 1-rightmargin-0.03,1-topmargin-0.03])
+
+    if downsample is not None:
+        # no more bins than pixels in the frame: 'sum', 'mean' or 'max' of the merged bins
+        framew = canvas.GetWw()*canvas.GetAbsWNDC()*(1-leftmargin-rightmargin)
+        frameh = canvas.GetWh()*canvas.GetAbsHNDC()*(1-topmargin-bottommargin)
+        with SNDprofile.stage('transform'):
+            hist = SNDtransform.transform(hist, ('downsample', framew, frameh, downsample))
+    hist = SNDtransform.drawCopy(hist)
+    with SNDprofile.stage('style'):
+        styleAxes(hist)
     
     if label is not None:
         hist.SetTitle(label)
@@ -365,36 +1182,74 @@ def draw2dHisto(hist, canvas=None,xaxtitle=None, yaxtitle=None,
 
     xax = hist.GetXaxis()
     #xax.SetNdivisions(5,4,0,ROOT.kTRUE)
-    xax.SetLabelFont(10*xaxlabelfont+3)
-    xax.SetLabelSize(xaxlabelsize)
+    if xaxlabelfont is not None: xax.SetLabelFont(10*xaxlabelfont+3)
+    if xaxlabelsize is not None: xax.SetLabelSize(xaxlabelsize)
     if xaxtitle is not None:
         xax.SetTitle(xaxtitle)
-    xax.SetTitleFont(10*axtitlefont+3)
-    xax.SetTitleSize(axtitlesize)
-    xax.SetTitleOffset(1.2)
 
     yax = hist.GetYaxis()
     yax.SetMaxDigits(3)
-    yax.SetNdivisions(8,4,0,ROOT.kTRUE)
-    yax.SetLabelFont(10*yaxlabelfont+3)
-    yax.SetLabelSize(yaxlabelsize)
 
     if yaxtitle is not None: 
         yax.SetTitle(yaxtitle)
-    yax.SetTitleFont(10*axtitlefont+3)
-    yax.SetTitleSize(axtitlesize)
-    yax.SetTitleOffset(1.2)
     
-    hist.Draw(drawoptions)
-    ROOT.gPad.RedrawAxis()
-    writeSND(canvas, extratext=extratext, text_in=False)
-    ROOT.gPad.Update()
-    canvas.Draw()
-    canvas.SaveAs(outpath+hist.GetName()+'.pdf', 'pdf')
+    with SNDprofile.stage('Draw'):
+        if raster:
+            _drawRasterBody(hist, canvas, drawoptions)
+        else:
+            hist.Draw(drawoptions)
+        ROOT.gPad.RedrawAxis()
+    with SNDprofile.stage('writeSND'):
+        writeSND(canvas, extratext=extratext, text_in=False)
+    saveCanvas(canvas, outpath+hist.GetName(), formats)
+
+def _drawRasterBody(hist, pad, drawoptions='COLZ'):
+    # the colour map is painted into an image as large as the frame and embedded as such,
+    # axes, palette and text stay vector graphics
+    lm, rm = pad.GetLeftMargin(), pad.GetRightMargin()
+    tm, bm = pad.GetTopMargin(), pad.GetBottomMargin()
+    framew = int(pad.GetWw()*pad.GetAbsWNDC()*(1-lm-rm))
+    frameh = int(pad.GetWh()*pad.GetAbsHNDC()*(1-tm-bm))
+    body = ROOT.TCanvas(pad.GetName()+'_raster', '', framew, frameh)
+    body.SetMargin(0., 0., 0., 0.)
+    body.SetLogz(pad.GetLogz())
+    # a throwaway clone: hist is a drawCopy (kCanDelete), Close() would delete it with the primitives of body
+    bodyhist = hist.Clone(hist.GetName()+'_raster')
+    bodyhist.SetDirectory(0)
+    bodyhist.ResetBit(ROOT.kCanDelete)
+    bodyhist.Draw('COL A')
+    img = ROOT.TImage.Create()
+    img.FromPad(body)
+    body.Close()
+    del bodyhist
+    pad.cd()
+    hist.Draw('AXIS')
+    imgpad = ROOT.TPad(pad.GetName()+'_body', '', lm, bm, 1-rm, 1-tm)
+    imgpad.SetMargin(0., 0., 0., 0.)
+    imgpad.SetFillStyle(4000)
+    for obj in (img, imgpad):
+        ROOT.SetOwnership(obj, False)
+        obj.SetBit(ROOT.kCanDelete)
+    imgpad.Draw()
+    imgpad.cd()
+    img.Draw()
+    pad.cd()
+    if 'Z' in drawoptions.upper():
+        palette = ROOT.TPaletteAxis(0., 0., 1., 1., hist)
+        palette.SetX1NDC(1-rm+0.005)
+        palette.SetX2NDC(1-rm+0.045)
+        palette.SetY1NDC(bm)
+        palette.SetY2NDC(1-tm)
+        ROOT.SetOwnership(palette, False)
+        palette.SetBit(ROOT.kCanDelete)
+        palette.Draw()
 
+@SNDprofile.profiled
 def drawMultiHisto(histlist, c1=None, figname='multihisto', xaxtitle=None, yaxtitle=None,
 	    normalize=False, dolegend=True, labellist=None, 
-	    colorlist=None, logy=False, drawoptions='', extra_text = '', rebin=None, outpath='.', scale=1., xaxrange=None):
+	    colorlist=None, logy=False, drawoptions='', extra_text = '', rebin=None, outpath='.', scale=1., xaxrange=None, formats=None, rangestats=False, adaptive=None):
+
+    if _skipUnchanged(outpath+figname, histlist, locals()): return
 
     if not c1: c1 = ROOT.TCanvas("c", "c", 800, 600)
 
@@ -406,39 +1261,29 @@ def drawMultiHisto(histlist, c1=None, figname='multihisto', xaxtitle=None, yaxti
     if(labellist is not None and len(labellist)!=len(histlist)):
         raise Exception('ERROR: length of label list does not agree with histogram list')
     
-    xaxlabelfont = 4 
-    xaxlabelsize = 22
-    yaxlabelfont = 4; yaxlabelsize = 22
-    axtitlefont = 6; axtitlesize = 26
     legendfont = 5
     leftmargin = 0.15
     rightmargin = 0.05
     topmargin = 0.05
     bottommargin = 0.15
-    c1.SetBottomMargin(bottommargin)
-    c1.SetLeftMargin(leftmargin)
-    c1.SetRightMargin(rightmargin)
-    c1.SetTopMargin(topmargin)
+    with SNDprofile.stage('style'):
+        useStyle('SND-multi', c1)
 
     pentryheight = 0.08
     nentries = 1 + len(histlist)
     if nentries>3: pentryheight = pentryheight*0.8
     plegendbox = ([leftmargin+0.30,1-topmargin-pentryheight*nentries, 1-rightmargin-0.03,1-topmargin-0.03])
     
-    if rebin is not None:
-        for hist in histlist:
-            hist.Rebin(int(hist.GetNbinsX()/rebin))
-    
-    if scale !=1.:
-        for hist in histlist: hist.Scale(scale)
-
-    if normalize:
-        for hist in histlist:
-            hist.Scale(1./hist.Integral())
+    # the loaded histograms are left untouched, the plot is made on transformed copies
+    with SNDprofile.stage('transform'):
+        histlist = [SNDtransform.drawCopy(hist) for hist in SNDtransform.prepare(histlist, rebin, adaptive, scale, normalize)]
     
     pairs = list()
+    with SNDprofile.stage('style'):
+        for hist in histlist:
+            styleAxes(hist)
+            hist.SetStats(0)
     for hist in histlist:
-        hist.SetStats(0)
         pairs.append([hist.GetMaximum(), hist])
     print(pairs)
     maxpair = max(pairs,key=lambda item:item[0])
@@ -480,45 +1325,36 @@ def drawMultiHisto(histlist, c1=None, figname='multihisto', xaxtitle=None, yaxti
     legend.SetFillColor(ROOT.kWhite)
     legend.SetTextFont(10*legendfont+3)
     legend.SetBorderSize(0)
+    statslist = SNDstats.batchStats(histlist, xaxrange if rangestats else None)
     for i,hist in enumerate(histlist):
         label = hist.GetName()
         if labellist is not None: label = labellist[i]
         legend.AddEntry(hist,label,"FL")
-        #legend.AddEntry(hist, 'Integral: {:.2e}'.format(hist.Integral()), '')
-        legend.AddEntry(hist, 'Mean: {:.2e}'.format(hist.GetMean()), '')
-        legend.AddEntry(hist, 'Std dev: {:.2e}'.format(hist.GetStdDev()), '')
+        #legend.AddEntry(hist, 'Integral: {:.2e}'.format(statslist[i]['integral']), '')
+        legend.AddEntry(hist, 'Mean: {:.2e}'.format(statslist[i]['mean']), '')
+        legend.AddEntry(hist, 'Std dev: {:.2e}'.format(statslist[i]['stddev']), '')
     
 
     for h in histlist: 
         xax = h.GetXaxis()
-        xax.SetLabelSize(xaxlabelsize)
-        xax.SetLabelFont(10*xaxlabelfont+3)
         if xaxtitle is not None:
             xax.SetTitle(xaxtitle)
         elif 'Momentum' in h.GetTitle():
             xax.SetTitle('Momentum [GeV/c]')
         elif 'Energy' in h.GetTitle():
             xax.SetTitle('Energy [GeV]')
-        xax.SetTitleFont(10*axtitlefont+3)
-        xax.SetTitleSize(axtitlesize)
-        xax.SetTitleOffset(1.2)
         xax.CenterTitle(True)
         if xaxrange:
             xax.SetRangeUser(xaxrange[0], xaxrange[1])
         # Y-axis layout
         yax = h.GetYaxis()
         yax.SetMaxDigits(3)
-        yax.SetLabelFont(10*yaxlabelfont+3)
-        yax.SetLabelSize(yaxlabelsize)
         if yaxtitle:
             yax.SetTitle(yaxtitle)
         elif 'Momentum' in h.GetTitle() and not yaxtitle:
             yax.SetTitle('dN/dpdt [(GeV/c)^{-1}s^{-1}]')
         elif 'Energy' in h.GetTitle() and not yaxtitle:
             yax.SetTitle('dN/dEdt [GeV^{-1}s^{-1}]')
-        yax.SetTitleFont(10*axtitlefont+3)
-        yax.SetTitleSize(axtitlesize)
-        yax.SetTitleOffset(1.2)
         yax.CenterTitle(True)
 
     """if len(histlist) == 3:
@@ -526,200 +1362,458 @@ def drawMultiHisto(histlist, c1=None, figname='multihisto', xaxtitle=None, yaxti
             hist.Draw('same '+drawoptions)
         histlist[2].Draw("* SAME")
     else:"""
-    histlist[0].Draw(drawoptions)
-    for hist in histlist[1:]:
-        hist.Draw('same '+drawoptions)
+    with SNDprofile.stage('Draw'):
+        histlist[0].Draw(drawoptions)
+        for hist in histlist[1:]:
+            hist.Draw('same '+drawoptions)
+        ROOT.gPad.RedrawAxis()
     
-    ROOT.gPad.RedrawAxis()
-    writeSND(c1, extratext=extra_text)
+    with SNDprofile.stage('writeSND'):
+        writeSND(c1, extratext=extra_text)
     if dolegend: legend.DrawClone("same")
-    ROOT.gPad.Update()
-    c1.Draw()
-    c1.SaveAs(outpath+figname+'.pdf', 'pdf')
+    saveCanvas(c1, outpath+figname, formats)
 
-def MultiCanvas(query=None):
-    if len(options.inputFile) == 1: f = options.inputFile[0]
-    histlist = load_hists(f)
+def MultiCanvas(histfile, query=None, extratext=None, lumi=None, norm=False, scale=1., outpath='', grid=None, pagesize=None):
     if query == None:
-        Varlist = [histlist.keys()]
+        Varlist = [name for name, cname in listHists(histfile)]
     else:
         Varlist = query
-    noPlots = len(Varlist)
-    global canvs
-    canvs = createCanvas(noPlots)
-    for icanv, canv in enumerate(canvs.values()):
-        ipad = 0
-        min = 6*icanv
-        max = 6*(icanv+1)
-        if max > len(Varlist): max= len(Varlist)
-        for var in Varlist[min:max]:
-            sel_histo = histlist[var] 
-            #print('Var is', var, 'Selected histos', hlist, 'name', hlist[0].GetName(), hlist[1].GetName(), hlist[2].GetName())
-            pad = canv.cd(ipad+1)
-            logy = False
-            norm = True
-            axtitle = 'a.u.'
-            if options.lumi:
-                norm = False
-                axtitle='N'
-                logy=True
-                if options.norm: 
-                    norm = True
-                    axtitle= 'a.u.'
-            #drawDATAMC(hlist, c1=pad, xaxtitle=var, yaxtitle=axtitle, normalize=norm, extra_text='Comparison', logy=logy, lumi=options.lumi) There can be an option to plot TMVA-like canvas
-            drawSingleHisto(sel_hist, c1=pad, xaxtitle=sel_hist.GetXaxis().GetTitle(), yaxtitle=axtitle, extratext=options.extratext, logy=logy, drawoptions='HIST', outpath=outpath, scale=options.scalefactor, label=sel_hist.GetTitle())
-            ipad+=1
-        canv.SaveAs("canvas_"+str(icanv)+".pdf", "pdf") 
-
-parser = ArgumentParser()
-parser.add_argument("-f", nargs='+', dest="inputFile", help="input files", required=False)
-parser.add_argument("-labels", nargs='+', dest="labels", help="list of labels", required=False, default=None)
-parser.add_argument("-c", "--inputCanvas", dest="inputCanvas", help="single input canvas", required=False)
-parser.add_argument("-e", "--extratext", dest="extratext", help="extratext written below SND@LHC", default=None, required=False)
-parser.add_argument('-hname', nargs='+', dest="hname", help='List of histos to be drawn', required=False)
-parser.add_argument("--scale", dest="scalefactor", help="scale factor", required=False, type=float, default=1.)
-parser.add_argument("--lumi", dest="lumi", help="luminosity factor", required=False, type=float, default=None)
-parser.add_argument("--auto", dest="auto", action='store_true', help='Enables automatic mode',required=False, default=False)
-parser.add_argument("--sep", dest="sep", action='store_true', help='Enables multiple histos in same canvas',required=False, default=False)
-parser.add_argument("--norm", dest="norm", action='store_true', help='Normalizes multi-hist plotting',required=False, default=False)
-parser.add_argument("--dataMC", dest="dataMC", help='Enables dataMC comparison mode: data histogram must contain DATA in its name', action='store_true', required=False, default=False)
-parser.add_argument("-xrange", nargs='+', dest="xaxrange", help="X axis range", required=False, default=None)
-parser.add_argument("-yrange", nargs='+', dest="yaxrange", help="Y axis range", required=False, default=None)
-
-options = parser.parse_args()
-
-if options.inputFile and len(options.inputFile) > 1 and len(options.hname)>1: raise Exception('Multi-file & Multi-histos not yet implemented!')
-if options.inputFile and len(options.inputFile) > 1 and len(options.hname)==1 and options.labels == None: raise Exception('Please provide labellist for different input files!')
-singlefile= False
-if options.inputFile:
-    if len(options.inputFile) < 2:
-        options.inputFile = options.inputFile[0]
-        tmp = options.inputFile.split('.')
-        singlefile = True
-        if options.hname and len(options.hname)> 1:
-            Hlist = load_hists(options.inputFile, query=options.hname)
+    logy = False
+    axtitle = 'a.u.'
+    if lumi:
+        axtitle='N'
+        logy=True
+    #drawDATAMC(hlist, c1=pad, xaxtitle=var, yaxtitle=axtitle, normalize=norm, extra_text='Comparison', logy=logy, lumi=options.lumi) There can be an option to plot TMVA-like canvas
+    return drawPages(iterHists(histfile, Varlist), 'canvas', outpath, nplots=len(Varlist), grid=grid, pagesize=pagesize,
+                     draw1d=dict(yaxtitle=axtitle, extratext=extratext, logy=logy, drawoptions='HIST', scale=scale))
+
+def drawFilled(config, filled, outpath='', extratext='', ratio=None, opts1d=None, opts2d=None, pool=None):
+    # histograms of SNDfill.fillHists: DATA-MC comparisons, overlays of the samples or single plots
+    if pool is None: pool = CanvasPool()
+    if opts1d is None: opts1d = dict()
+    if opts2d is None: opts2d = dict()
+    for plot in config['plots']:
+        hists = filled[plot['name']]
+        histlist = list(hists.values())
+        if histlist[0].GetDimension() > 1:
+            for hist in histlist:
+                draw2dHisto(hist, pool.get(800, 600), extratext=extratext, outpath=outpath, **opts2d)
+        elif len(histlist) == 1:
+            drawSingleHisto(histlist[0], pool.get(800, 600), drawoptions='HIST', extratext=extratext, logy=plot.get('logy', False),
+                            outpath=outpath, **opts1d)
+        elif any('DATA' in sname for sname in hists):
+            drawDATAMC(histlist, pool.get(800, 800, 'ratio' if ratio else None), figname=plot['name'], normalize=plot.get('normalize', True),
+                       logy=plot.get('logy', False), extra_text=extratext, outpath=outpath, ratio=ratio, **opts1d)
         else:
-            Hlist = load_hists(options.inputFile)
+            drawMultiHisto(histlist, pool.get(800, 600), figname=plot['name'], drawoptions='HIST', labellist=list(hists),
+                           normalize=plot.get('normalize', False), logy=plot.get('logy', False), extra_text=extratext, outpath=outpath, **opts1d)
+
+def _drawJob(plot, hists, pool):
+    # one plot of a job file, hists are the HistDicts of the input files
+    histlist = [hists[f][key] for f, key in plot['inputs']]
+    args = plot['args']
+    if plot['type'] == 'single':
+        drawSingleHisto(histlist[0], pool.get(800, 600), **args)
+    elif plot['type'] == '2d':
+        draw2dHisto(histlist[0], pool.get(800, 600), **args)
+    elif plot['type'] == 'multi':
+        drawMultiHisto(histlist, pool.get(800, 600), **args)
     else:
-        tmp = [str(today)]
-        if options.hname and len(options.hname) < 2:
-            file_list = options.inputFile
-            Hlist = getHistFromfiles(file_list, options.hname[0], options.labels)
-            print(Hlist)
-    outpath = 'plots_'+tmp[0]+'/'
-    if not os.path.exists(outpath):
-            os.makedirs(outpath)
-    
-        
+        drawDATAMC(histlist, pool.get(800, 800, 'ratio' if args.get('ratio') else None), **args)
 
-canvases    = {}
-extratext=''
-if options.extratext:
-    extratext=options.extratext
+def _runPlots(task):
+    # draws a share of the plots of a job file, reading each of their inputs once
+    plots, useindex, forked = task
+    start = time.time()
+    if forked:
+        SNDprofile.reset()
+        ROOT.gROOT.SetBatch(True)
+    keys = {}
+    for plot in plots:
+        for f, key in plot['inputs']:
+            keys.setdefault(f, dict())[key] = None
+    hists = {f: load_hists(f, query=list(fkeys), useindex=useindex) for f, fkeys in keys.items()}
+    pool = CanvasPool()
+    for plot in plots:
+        _drawJob(plot, hists, pool)
+    pool.close()
+    for h in hists.values(): h.close()
+    updated = _manifest.updated if _manifest is not None else {}
+    # in the same process, the stages are already in the profile
+    return os.getpid(), len(plots), time.time()-start, updated, SNDprofile.collect() if forked else None
 
-xaxrange = None
-yaxrange = None
-if options.xaxrange:
-    xaxrange = list(options.xaxrange)
-if options.yaxrange:
-    yaxrange = list(options.yaxrange)
+def runJobs(jobfile, jobs=1, useindex=True, incremental=False):
+    """
+    Draws all the plots of a job file (see SNDjobs.py). Each (file, key) is read once whatever the
+    number of plots using it, and derived histograms (rebinned, scaled...) are shared between plots;
+    with jobs > 1 the independent groups of plots are drawn by worker processes.
+    """
+    plots, inputs, components = SNDjobs.planJobs(SNDjobs.readJobs(jobfile))
+    outpaths = set(plot['args'].get('outpath', '') for plot in plots)
+    for outpath in outpaths:
+        if outpath and not os.path.exists(outpath): os.makedirs(outpath)
+    if incremental:
+        # the manifest of the incremental mode is the one of a single output directory
+        if len(outpaths) > 1: raise Exception('ERROR: --incremental needs a single outpath, the job file has '+', '.join(sorted(outpaths)))
+        setIncremental(outpaths.pop())
+    print('{} plots, {} inputs in {} files, {} independent groups'.format(
+        len(plots), sum(len(keys) for keys in inputs.values()), len(inputs), len(components)))
+    start = time.time()
+    shares = SNDjobs.balance(components, max(1, min(jobs, len(components))))
+    if len(shares) == 1:
+        results = [_runPlots(([plots[i] for i in shares[0]], useindex, False))]
+    else:
+        import multiprocessing
+        pool = multiprocessing.get_context('fork').Pool(len(shares))
+        try:
+            results = pool.map(_runPlots, [([plots[i] for i in share], useindex, True) for share in shares], chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    for pid, nplots, elapsed, updated, profile in results:
+        if _manifest is not None: _manifest.entries.update(updated)
+        if profile is not None: SNDprofile.merge(profile)
+    print('{} plots in {:.1f} s with {} workers'.format(len(plots), time.time()-start, len(shares)))
+
+def _runJob(argv, cwd=None):
+    # runs one server job, with the same options as the command line
+    import contextlib
+    import io
+    import traceback
+    del savedFiles[:]
+    log = io.StringIO()
+    start = time.time()
+    olddir = os.getcwd()
+    reply = {'status': 'ok', 'error': ''}
+    try:
+        if cwd: os.chdir(cwd)
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            main(argv)
+    except SystemExit as e:
+        if e.code:
+            reply = {'status': 'error', 'error': 'invalid options'}
+    except Exception:
+        reply = {'status': 'error', 'error': traceback.format_exc()}
+    finally:
+        os.chdir(olddir)
+        finishIncremental()
+        finishMultiPage()
+        # drop the histograms the job detached into gROOT, the input files stay open;
+        # the memoized transforms refer to them and could be matched by the next job's histograms
+        SNDtransform.clearTransforms()
+        ROOT.gROOT.GetList().Delete()
+    reply['outputs'] = [os.path.join(cwd or olddir, f) for f in savedFiles]
+    reply['log'] = log.getvalue()
+    reply['time'] = time.time()-start
+    return reply
 
-if options.inputFile:
+def serve(socketpath):
+    import json
+    import socketserver
+    global _openFiles
+    _openFiles = dict()
+    ROOT.gROOT.SetBatch(True)
     init_style()
-    if not options.hname and options.auto:
-        for i_h,h in enumerate(Hlist.values()):
-            if i_h not in canvases.keys():
-                canvases[i_h] = ROOT.TCanvas("c"+str(i_h), "c"+str(i_h), 800, 600)
-            htype = h.IsA().GetName()
-            if 'TH1' in htype:
-                drawSingleHisto(h, canvases[i_h], drawoptions='HIST', extratext=extratext, logy=True, outpath=outpath)
-            elif 'TH2' in htype:
-                draw2dHisto(h, canvases[i_h], extratext=extratext, outpath=outpath)
-    elif options.auto and len(options.hname) < 2:
-        if singlefile:
-            i_h = 0
-            options.hname = options.hname[0]
-            canvases[i_h] = ROOT.TCanvas("c"+str(i_h), "c"+str(i_h), 800, 800)
-            htype = Hlist[options.hname].IsA().GetName()
-            sel_hist = Hlist[options.hname]
-            if 'TH1' in htype:
-                drawSingleHisto(Hlist[options.hname], canvases[i_h], drawoptions='HIST', extratext=extratext, logy=False, outpath=outpath, scale=options.scalefactor, label=sel_hist.GetTitle(), xaxtitle=sel_hist.GetXaxis().GetTitle(), yaxtitle=sel_hist.GetYaxis().GetTitle(), xaxrange=xaxrange, yaxrange=yaxrange) #,xaxrange[])
-            elif 'TH2' in htype:
-                draw2dHisto(Hlist[options.hname], canvases[i_h], extratext=extratext, outpath=outpath)
+
+    class JobHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            job = json.loads(self.rfile.readline())
+            reply = _runJob(job['argv'], job.get('cwd'))
+            print('Job {} done in {:.3f} s: {}'.format(' '.join(job['argv']), reply['time'], reply['status']))
+            self.wfile.write((json.dumps(reply)+'\n').encode())
+
+    if os.path.exists(socketpath): os.remove(socketpath)
+    # jobs are run one at a time, ROOT is not thread-safe
+    server = socketserver.UnixStreamServer(socketpath, JobHandler)
+    print('SNDLHCplotter server listening on', socketpath)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socketpath)
+        for size, mtime, f in _openFiles.values(): f.Close()
+        _openFiles = None
+
+def submit(socketpath, argv):
+    import json
+    import socket
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socketpath)
+    client.sendall((json.dumps({'argv': argv, 'cwd': os.getcwd()})+'\n').encode())
+    client.shutdown(socket.SHUT_WR)
+    data = b''
+    chunk = client.recv(65536)
+    while chunk:
+        data += chunk
+        chunk = client.recv(65536)
+    client.close()
+    reply = json.loads(data)
+    sys.stdout.write(reply['log'])
+    for f in reply['outputs']: print(f)
+    if reply['status'] != 'ok':
+        sys.stderr.write(reply['error']+'\n')
+        sys.exit(1)
+
+def _pair(value):
+    # '4x3' -> (4, 3)
+    nx, ny = value.lower().split('x')
+    return int(nx), int(ny)
+
+def main(argv=None):
+    parser = ArgumentParser()
+    parser.add_argument("-f", nargs='+', dest="inputFile", help="input files", required=False)
+    parser.add_argument("-labels", nargs='+', dest="labels", help="list of labels", required=False, default=None)
+    parser.add_argument("-c", "--inputCanvas", dest="inputCanvas", help="single input canvas", required=False)
+    parser.add_argument("-e", "--extratext", dest="extratext", help="extratext written below SND@LHC", default=None, required=False)
+    parser.add_argument('-hname', nargs='+', dest="hname", help='List of histos to be drawn', required=False)
+    parser.add_argument("--scale", dest="scalefactor", help="scale factor", required=False, type=float, default=1.)
+    parser.add_argument("--lumi", dest="lumi", help="luminosity factor", required=False, type=float, default=None)
+    parser.add_argument("--auto", dest="auto", action='store_true', help='Enables automatic mode',required=False, default=False)
+    parser.add_argument("--sep", dest="sep", action='store_true', help='Enables multiple histos in same canvas',required=False, default=False)
+    parser.add_argument("--norm", dest="norm", action='store_true', help='Normalizes multi-hist plotting',required=False, default=False)
+    parser.add_argument("--dataMC", dest="dataMC", help='Enables dataMC comparison mode: data histogram must contain DATA in its name', action='store_true', required=False, default=False)
+    parser.add_argument("-xrange", nargs='+', dest="xaxrange", help="X axis range", required=False, default=None)
+    parser.add_argument("-yrange", nargs='+', dest="yaxrange", help="Y axis range", required=False, default=None)
+    parser.add_argument("--ratio", dest="ratio", nargs='?', const='ratio', choices=['ratio', 'pull'], help='Adds a Data/MC ratio (or pull) panel in dataMC mode', required=False, default=None)
+    parser.add_argument("--scan", dest="scan", nargs='?', const=10, type=int, help='Ranks the DATA/MC pairs by compatibility and draws the SCAN worst ones', required=False, default=None)
+    parser.add_argument("--downsample", dest="downsample", choices=['sum', 'mean', 'max'], help='Reduces 2D histograms to the frame resolution', required=False, default=None)
+    parser.add_argument("--raster", dest="raster", action='store_true', help='Draws the colour map of 2D histograms as an image', required=False, default=False)
+    parser.add_argument("--rebin-relerr", dest="rebinrelerr", type=float, help='Variable-width rebinning of 1D histograms, merging bins up to this relative error', required=False, default=None)
+    parser.add_argument("--rebin-min", dest="rebinmin", type=float, help='Variable-width rebinning of 1D histograms, merging bins up to this number of entries', required=False, default=None)
+    parser.add_argument("--variants", dest="variants", action='store_true', help='Draws 1D histograms in auto-mode linear and log, raw and normalized', required=False, default=False)
+    parser.add_argument("--grid", dest="grid", type=_pair, help='Pads per page in --sep mode, e.g. 4x3', required=False, default=None)
+    parser.add_argument("--pagesize", dest="pagesize", type=_pair, help='Page size in pixels in --sep mode, e.g. 1600x1200', required=False, default=None)
+    parser.add_argument("--list", dest="list", action='store_true', help='Lists the histograms of the input file(s) and exits', required=False, default=False)
+    parser.add_argument("--noindex", dest="noindex", action='store_true', help='Disables the sidecar index of the input files', required=False, default=False)
+    parser.add_argument("-j", "--jobs", dest="jobs", help="number of worker processes for auto-mode over a whole file, or for a job file", required=False, type=int, default=1)
+    parser.add_argument("--stream", dest="stream", action='store_true', help='Auto-mode over a whole file reading, drawing and freeing one histogram at a time', required=False, default=False)
+    parser.add_argument("--prefetch", dest="prefetch", type=int, help='Reads the next PREFETCH objects in the background while drawing', required=False, default=0)
+    parser.add_argument("--watch", dest="watch", nargs='?', const=0.5, type=float, help='Redraws the histograms updated in the input file, polling every WATCH seconds', required=False, default=None)
+    parser.add_argument("--merge", dest="merge", action='store_true', help='Sums the -hname histograms over all input files', required=False, default=False)
+    parser.add_argument("--threads", dest="threads", type=int, help='Number of threads reading input files in merge mode, or filling in --fill mode', required=False, default=0)
+    parser.add_argument("--jobfile", dest="jobfile", help='Draws all the plots listed in this JSON/YAML job file', required=False, default=None)
+    parser.add_argument("--fill", dest="fill", help='Fills and plots the histograms described in this JSON config from TTrees', required=False, default=None)
+    parser.add_argument("--style", dest="style", choices=sorted(SNDstyle.STYLES), help='Draws all plots with this style instead of the one of their kind', required=False, default=None)
+    parser.add_argument("--logo", dest="logo", help='Image file drawn in the top right corner of every plot', required=False, default=None)
+    parser.add_argument("--profile", dest="profile", nargs='?', const='profile.json', help='Times the stages of the run and writes the profile into this JSON file', required=False, default=None)
+    parser.add_argument("--onefile", dest="onefile", nargs='?', const='', help='Writes all plots into a single multi-page PDF', required=False, default=None)
+    parser.add_argument("--canvasfile", dest="canvasfile", help='ROOT file where the canvases are written in --onefile mode', required=False, default=None)
+    parser.add_argument("--formats", dest="formats", help='Comma-separated output formats: pdf,png,svg,root,...', required=False, default='pdf')
+    parser.add_argument("--pngwidth", dest="pngwidth", type=int, help='Width in pixels of the png outputs', required=False, default=None)
+    parser.add_argument("--thumbnail", dest="thumbwidth", type=int, help='Width in pixels of the png thumbnails', required=False, default=None)
+    parser.add_argument("--incremental", dest="incremental", action='store_true', help='Only redraws plots whose inputs changed', required=False, default=False)
+    parser.add_argument("--serve", dest="serve", help="starts a plotting server on this unix socket", required=False, default=None)
+    parser.add_argument("--submit", dest="submit", help="submits the job to the plotting server on this unix socket", required=False, default=None)
+
+    if argv is None: argv = sys.argv[1:]
+    options = parser.parse_args(argv)
+
+    setOutputFormats(options.formats, options.pngwidth, options.thumbwidth)
+    SNDprofile.enable(options.profile is not None)
+    forceStyle(options.style)
+    setLogo(options.logo)
+
+    if options.serve:
+        if _openFiles is not None: raise Exception('ERROR: nested --serve in a server job')
+        serve(options.serve)
+        return
+    if options.submit:
+        # forward everything but the --submit option itself
+        jobargv = list()
+        skip = False
+        for arg in argv:
+            if skip: skip = False
+            elif arg == '--submit': skip = True
+            elif not arg.startswith('--submit='): jobargv.append(arg)
+        submit(options.submit, jobargv)
+        return
+
+    if options.list and options.inputFile:
+        for f in options.inputFile: printIndex(f)
+        return
+
+    if options.onefile is not None and (options.incremental or options.jobs > 1): raise Exception('--onefile cannot be used with --incremental or --jobs!')
+    if options.merge and not options.hname: raise Exception('Please provide the histograms to be merged with -hname!')
+    if options.inputFile and len(options.inputFile) > 1 and not options.merge and len(options.hname)>1: raise Exception('Multi-file & Multi-histos not yet implemented!')
+    if options.inputFile and len(options.inputFile) > 1 and not options.merge and len(options.hname)==1 and options.labels == None: raise Exception('Please provide labellist for different input files!')
+    singlefile= False
+    if options.inputFile:
+        if len(options.inputFile) < 2:
+            options.inputFile = options.inputFile[0]
+            tmp = options.inputFile.split('.')
+            singlefile = True
+            if options.hname and len(options.hname)> 1:
+                Hlist = load_hists(options.inputFile, query=options.hname, useindex=not options.noindex, prefetch=options.prefetch)
+            elif options.scan is not None:
+                Hlist = None # the scan reads the file itself
+            elif options.watch or (not options.hname and options.auto and (options.jobs > 1 or options.stream)):
+                Hlist = None # workers read the file themselves, streaming or watch mode
+            else:
+                Hlist = load_hists(options.inputFile, useindex=not options.noindex, prefetch=options.prefetch)
         else:
-            i_h = 0
-            options.hname = options.hname[0]
-            canvases[i_h] = ROOT.TCanvas("c"+str(i_h), "c"+str(i_h), 800, 800)
-            for hist in Hlist.values():
-                if not 'TH1' in hist.IsA().GetName(): 
-                    print('Not supported!')
+            tmp = [str(today)]
+            if options.merge:
+                # the sums are then plotted as the histograms of a single file
+                Hlist = mergeHistFromfiles(options.inputFile, options.hname, threads=options.threads)
+                singlefile = True
+            elif options.hname and len(options.hname) < 2:
+                file_list = options.inputFile
+                Hlist = getHistFromfiles(file_list, options.hname[0], options.labels, useindex=not options.noindex, prefetch=options.prefetch)
+                print(Hlist)
+        outpath = 'plots_'+tmp[0]+'/'
+        if not os.path.exists(outpath):
+                os.makedirs(outpath)
+        if options.incremental: setIncremental(outpath)
+        if options.onefile is not None:
+            setMultiPage(options.onefile or outpath+os.path.basename(tmp[0])+'.pdf', options.canvasfile)
+    
+        
+
+    canvases    = {}
+    extratext=''
+    if options.extratext:
+        extratext=options.extratext
+
+    opts1d = dict()
+    if options.rebinrelerr is not None or options.rebinmin is not None:
+        opts1d['adaptive'] = dict(relerr=options.rebinrelerr, mincount=options.rebinmin)
+    opts2d = dict(downsample=options.downsample, raster=options.raster)
+    # auto-mode over a whole file
+    autoopts = dict(opts1d, variants=options.variants)
+
+    xaxrange = None
+    yaxrange = None
+    if options.xaxrange:
+        xaxrange = list(options.xaxrange)
+    if options.yaxrange:
+        yaxrange = list(options.yaxrange)
+
+    if options.inputFile:
+        init_style()
+        pool = CanvasPool()
+        if options.scan is not None and singlefile and not options.merge:
+            scanDataMC(options.inputFile, top=options.scan, outpath=outpath, extratext=extratext, useindex=not options.noindex)
+        elif options.watch and singlefile and not options.merge:
+            watch(options.inputFile, interval=options.watch, extratext=extratext, outpath=outpath, opts1d=autoopts, opts2d=opts2d, names=options.hname)
+        elif not options.hname and options.auto and options.jobs > 1:
+            renderParallel(options.inputFile, options.jobs, extratext=extratext, outpath=outpath, useindex=not options.noindex, opts1d=autoopts, opts2d=opts2d)
+        elif not options.hname and options.auto and options.stream:
+            renderStream(options.inputFile, extratext=extratext, outpath=outpath, useindex=not options.noindex, opts1d=autoopts, opts2d=opts2d, prefetch=options.prefetch)
+        elif not options.hname and options.auto:
+            for i_h,h in enumerate(Hlist.values()):
+                # one canvas, cleared for each plot
+                canvases[0] = pool.get(800, 600)
+                htype = h.IsA().GetName()
+                if 'TH1' in htype:
+                    _drawAuto1d(h, canvases[0], extratext, outpath, autoopts)
+                elif 'TH2' in htype:
+                    draw2dHisto(h, canvases[0], extratext=extratext, outpath=outpath, **opts2d)
+        elif options.auto and len(options.hname) < 2:
+            if singlefile:
+                i_h = 0
+                options.hname = options.hname[0]
+                canvases[i_h] = ROOT.TCanvas("c"+str(i_h), "c"+str(i_h), 800, 800)
+                htype = Hlist[options.hname].IsA().GetName()
+                sel_hist = Hlist[options.hname]
+                if 'TH1' in htype:
+                    drawSingleHisto(Hlist[options.hname], canvases[i_h], drawoptions='HIST', extratext=extratext, logy=False, outpath=outpath, scale=options.scalefactor, label=sel_hist.GetTitle(), xaxtitle=sel_hist.GetXaxis().GetTitle(), yaxtitle=sel_hist.GetYaxis().GetTitle(), xaxrange=xaxrange, yaxrange=yaxrange, **opts1d) #,xaxrange[])
+                elif 'TH2' in htype:
+                    draw2dHisto(Hlist[options.hname], canvases[i_h], extratext=extratext, outpath=outpath, **opts2d)
+            else:
+                i_h = 0
+                options.hname = options.hname[0]
+                canvases[i_h] = ROOT.TCanvas("c"+str(i_h), "c"+str(i_h), 800, 800)
+                for hist in Hlist.values():
+                    if not 'TH1' in hist.IsA().GetName(): 
+                        print('Not supported!')
+                        continue
+                drawMultiHisto(list(Hlist.values()), canvases[i_h], drawoptions='HIST', extra_text=extratext, outpath=outpath, scale=options.scalefactor, yaxtitle=list(Hlist.values())[0].GetYaxis().GetTitle(), xaxtitle=list(Hlist.values())[0].GetXaxis().GetTitle(), normalize=options.norm, **opts1d)
+        elif options.auto and len(options.hname)>1:
+            if options.sep:
+                # pages of plots, read one at a time from the input file
+                hists = iterHists(options.inputFile, options.hname, options.prefetch) if singlefile and not options.merge else Hlist.values()
+                drawPages(hists, 'canvas', outpath, nplots=len(options.hname), grid=options.grid, pagesize=options.pagesize, pool=pool,
+                          draw1d=dict(drawoptions='HIST', extratext=extratext, logy=True, scale=options.scalefactor, **opts1d),
+                          draw2d=dict(extratext=extratext, **opts2d))
+            else:
+                i_h = 0
+                canvases[i_h] = ROOT.TCanvas("c"+str(i_h), "c"+str(i_h), 800, 800)
+                if options.dataMC:
+                    drawDATAMC(list(Hlist.values()), canvases[i_h], xaxtitle=list(Hlist.values())[0].GetXaxis().GetTitle(), yaxtitle=list(Hlist.values())[0].GetYaxis().GetTitle(), normalize=True, extra_text='DATA-MC Comparison', ratio=options.ratio, outpath=outpath, **opts1d)
+                else:
+                    drawMultiHisto(list(Hlist.values()), canvases[i_h], logy=False, drawoptions='HIST', extra_text=extratext, outpath=outpath, scale=options.scalefactor, yaxtitle='Counts', xaxtitle='diff (#mu_{out}-#mu_{in})', normalize=options.norm, labellist=options.labels, **opts1d)
+
+
+    #################################################################################
+
+    elif options.jobfile:
+        init_style()
+        runJobs(options.jobfile, jobs=options.jobs, useindex=not options.noindex, incremental=options.incremental)
+
+    elif options.fill:
+        config = SNDfill.readConfig(options.fill)
+        outpath = 'plots_'+os.path.splitext(os.path.basename(options.fill))[0]+'/'
+        if not os.path.exists(outpath): os.makedirs(outpath)
+        start = time.time()
+        filled = SNDfill.fillHists(config, threads=options.threads or None)
+        print('{} histograms filled in {:.1f} s'.format(sum(len(h) for h in filled.values()), time.time()-start))
+        if config.get('output'): SNDfill.writeHists(filled, config['output'])
+        init_style()
+        drawFilled(config, filled, outpath=outpath, extratext=extratext, ratio=options.ratio, opts1d=opts1d, opts2d=opts2d)
+
+    elif options.inputCanvas:
+        f = ROOT.TFile.Open(options.inputCanvas)
+        keylist = f.GetListOfKeys()
+        clist = list()
+        if options.prefetch:
+            names = [key.GetName() for key in keylist]
+            for path, name, canvas in SNDprefetch.Prefetcher([(options.inputCanvas, name) for name in names], options.prefetch):
+                if canvas is None:
+                    print('### WARNING ###: cannot read "'+str(name)+'", skipping.')
                     continue
-            drawMultiHisto(list(Hlist.values()), canvases[i_h], drawoptions='HIST', extra_text=extratext, outpath=outpath, scale=options.scalefactor, yaxtitle=list(Hlist.values())[0].GetYaxis().GetTitle(), xaxtitle=list(Hlist.values())[0].GetXaxis().GetTitle(), normalize=options.norm)
-    elif options.auto and len(options.hname)>1:
-        if options.sep:
-            _hlist = list(Hlist.values())
-            canvases = createCanvas(len(_hlist))
-            for icanv, c in enumerate(canvases.values()):
-                ipad = 0
-                min = 6*icanv
-                max = 6*(icanv+1)
-                if max > len(_hlist): max= len(_hlist)
-                for _h in _hlist[min:max]:
-                    pad = c.cd(ipad+1)
-                    htype = _h.IsA().GetName()
-                    if 'TH1' in htype:
-                        logy=True
-                        drawSingleHisto(_h, pad, drawoptions='HIST', extratext=extratext, logy=logy, outpath=outpath, scale=options.scalefactor, xaxtitle=_h.GetXaxis().GetTitle(), yaxtitle=_h.GetYaxis().GetTitle())
-                        ipad+=1
-                    elif 'TH2' in htype:
-                        draw2dHisto(_h, pad, extratext=extratext, outpath=outpath)
-                        ipad+=1
-                    else:
-                        raise Exception('Object type not recognized.')    
+                canvas.SetName(name)
+                clist.append(canvas)
         else:
-            i_h = 0
-            canvases[i_h] = ROOT.TCanvas("c"+str(i_h), "c"+str(i_h), 800, 800)
-            if options.dataMC:
-                drawDATAMC(list(Hlist.values()), canvases[i_h], xaxtitle=list(Hlist.values())[0].GetXaxis().GetTitle(), yaxtitle=list(Hlist.values())[0].GetYaxis().GetTitle(), normalize=True, extra_text='DATA-MC Comparison')
-            else:
-                drawMultiHisto(list(Hlist.values()), canvases[i_h], logy=False, drawoptions='HIST', extra_text=extratext, outpath=outpath, scale=options.scalefactor, yaxtitle='Counts', xaxtitle='diff (#mu_{out}-#mu_{in})', normalize=options.norm, labellist=options.labels)
-
-
-#################################################################################
-
-elif options.inputCanvas:
-    f = ROOT.TFile.Open(options.inputCanvas)
-    keylist = f.GetListOfKeys()
-    clist = list()
-    for key in keylist:
-        canvas = f.Get(key.GetName())
-        canvas.SetName(key.GetName())
-        clist.append(canvas)
-    #f.Close()
-    histlist = list()
-    legendlist = list()
-    for c in clist:
-        _list = c.GetListOfPrimitives()
-        for l in _list:
-            #print(l.IsA().GetName())
-            if 'TH1' in l.IsA().GetName():
-                histlist.append(l)
-            elif 'TLegend' in l.IsA().GetName():
-                legendlist.append(l)
-    init_style()
-    if len(histlist)==1:
-        canvases[0] = ROOT.TCanvas("c"+str(0), "c"+str(0), 800, 600)
-        h = histlist[0]
-        drawSingleHisto(h, canvases[0], drawoptions=h.GetDrawOption(), extratext=extratext, logy=True, outpath='')
-    elif len(histlist)== 2:
-        #for p in legendlist[0].GetListOfPrimitives():
-        #    print(p.GetLabel())
-        canvases[0] = ROOT.TCanvas("c"+str(0), "c"+str(0), 800, 600)
-        #drawDATAMC(histlist=histlist, c1=canvases[0], xaxtitle='US QDC', yaxtitle='a.u.', 
-        #           dolegend=True, labellist=['Data: 39 fb^{-1}', 'MonteCarlo shifted'], figname='USQDCcomparison', rebin=110)
-        drawDATAMC(histlist=histlist, c1=canvases[0], xaxtitle='N SciFi hits', yaxtitle='a.u.', 
-                   dolegend=True, labellist=['Data: 39 fb^{-1}', 'MonteCarlo'], figname='Nsfhits', logy=True, extra_text=extratext)
-            
-
-
-# edit the last part in order to take and sort all of the items present in the .root file (frame, th1, tlegend, tpavetext...)
\ No newline at end of file
+            for key in keylist:
+                canvas = f.Get(key.GetName())
+                canvas.SetName(key.GetName())
+                clist.append(canvas)
+        #f.Close()
+        histlist = list()
+        legendlist = list()
+        for c in clist:
+            _list = c.GetListOfPrimitives()
+            for l in _list:
+                #print(l.IsA().GetName())
+                if 'TH1' in l.IsA().GetName():
+                    histlist.append(l)
+                elif 'TLegend' in l.IsA().GetName():
+                    legendlist.append(l)
+        init_style()
+        if len(histlist)==1:
+            canvases[0] = ROOT.TCanvas("c"+str(0), "c"+str(0), 800, 600)
+            h = histlist[0]
+            drawSingleHisto(h, canvases[0], drawoptions=h.GetDrawOption(), extratext=extratext, logy=True, outpath='')
+        elif len(histlist)== 2:
+            #for p in legendlist[0].GetListOfPrimitives():
+            #    print(p.GetLabel())
+            canvases[0] = ROOT.TCanvas("c"+str(0), "c"+str(0), 800, 600)
+            #drawDATAMC(histlist=histlist, c1=canvases[0], xaxtitle='US QDC', yaxtitle='a.u.', 
+            #           dolegend=True, labellist=['Data: 39 fb^{-1}', 'MonteCarlo shifted'], figname='USQDCcomparison', rebin=110)
+            drawDATAMC(histlist=histlist, c1=canvases[0], xaxtitle='N SciFi hits', yaxtitle='a.u.', 
+                       dolegend=True, labellist=['Data: 39 fb^{-1}', 'MonteCarlo'], figname='Nsfhits', logy=True, extra_text=extratext)
+
+
+    # edit the last part in order to take and sort all of the items present in the .root file (frame, th1, tlegend, tpavetext...)
+    finishIncremental()
+    finishMultiPage()
+    SNDprefetch.reportIO()
+    SNDprofile.report(options.profile)
+    return canvases
+
+
+if __name__ == '__main__':
+    # keep the canvases alive for interactive sessions (python -i)
+    canvases = main()
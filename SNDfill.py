@@ -0,0 +1,158 @@
+"""
+    SNDfill.py    Histograms filled from TTrees in a single event loop, driven by a plot config
+
+    All the histograms of a config are booked on one RDataFrame per sample and filled together,
+    with implicit multithreading: 200 distributions of a tree cost one event loop over all cores,
+    not 200 loops. The config is a JSON file:
+
+    {
+      "tree": "cbmsim",
+      "threads": 0,                                   # 0: all cores, 1: single thread
+      "defines": {"nsf": "Digi_ScifiHits.size()"},    # new columns, for all samples
+      "cuts": ["nsf > 0"],                            # for all samples and plots
+      "weight": "w",                                  # default weight, optional
+      "output": "filled.root",                        # optional, the histograms are also written here
+      "samples": {
+        "DATA": {"files": ["data_*.root"]},
+        "MC":   {"files": ["mc.root"], "weight": "w", "cut": "...", "scale": 0.3}
+      },
+      "plots": [
+        {"name": "Nscifi_hits", "var": "nsf", "bins": [100, 0, 1000], "title": ";N SciFi hits;Events"},
+        {"name": "E", "var": "E", "bins": [[0, 10, 20, 50, 100]], "cut": "E > 0", "samples": ["MC"]},
+        {"name": "xy", "var": ["x", "y"], "bins": [100, -50, 0, 100, 0, 50]}
+      ]
+    }
+
+    "var" and "weight" are column names or expressions, "bins" gives each axis in turn as nbins, min, max
+    or as the list of its bin edges, e.g. [[0, 1, 5], 10, 0, 50]. Plot keys override the sample ones,
+    which override the global ones.
+    A histogram is named <sample>_<plot name>, so DATA samples are recognized by drawDATAMC.
+"""
+import glob
+import json
+from array import array
+
+from SNDstyle import ROOT
+
+
+def readConfig(path):
+    with open(path) as fin:
+        config = json.load(fin)
+    for key in ('tree', 'samples', 'plots'):
+        if key not in config: raise Exception('ERROR: "'+key+'" missing in '+path)
+    for plot in config['plots']: _axes(plot)
+    return config
+
+def _files(patterns):
+    # glob patterns are expanded, remote urls are kept as they are
+    files = list()
+    for pattern in patterns:
+        files.extend(sorted(glob.glob(pattern)) or [pattern])
+    return files
+
+def _axes(plot):
+    # the binning of each axis, (nbins, min, max) or the list of bin edges
+    bins = list(plot['bins'])
+    ndim = len(plot['var']) if isinstance(plot['var'], list) else 1
+    axes = list()
+    while bins and len(axes) < ndim:
+        if isinstance(bins[0], list):
+            if len(bins[0]) < 2: raise Exception('ERROR: less than 2 bin edges in "bins" of '+plot['name'])
+            axes.append(bins.pop(0))
+        elif len(bins) >= 3 and not any(isinstance(b, list) for b in bins[:3]):
+            axes.append(tuple(bins[:3]))
+            del bins[:3]
+        else:
+            break
+    if len(axes) != ndim or bins:
+        raise Exception('ERROR: "bins" of '+plot['name']+' should give '+str(ndim)+' axes, each as nbins, min, max or a list of edges')
+    return axes
+
+def _model(name, plot):
+    title = plot.get('title', '')
+    axes = _axes(plot)
+    if all(isinstance(a, tuple) for a in axes):
+        args = [x for n, lo, hi in axes for x in (int(n), lo, hi)]
+    else:
+        # mixed fixed and variable binning: the fixed axes are given as edges as well
+        args = list()
+        for a in axes:
+            edges = a if isinstance(a, list) else [a[1]+(a[2]-a[1])*i/int(a[0]) for i in range(int(a[0])+1)]
+            args.extend((len(edges)-1, array('d', edges)))
+    if len(axes) == 2: return ROOT.RDF.TH2DModel(name, title, *args)
+    return ROOT.RDF.TH1DModel(name, title, *args)
+
+class _Sample(object):
+    # the nodes of the computation graph of one sample: columns defined once, one filter per cut
+    def __init__(self, tree, files, defines, cuts):
+        self.df = ROOT.RDataFrame(tree, _files(files))
+        self.columns = set(str(c) for c in self.df.GetColumnNames())
+        self.expressions = {}
+        for name, expr in defines.items():
+            self.df = self.df.Define(name, expr)
+            self.columns.add(name)
+        for cut in cuts:
+            if cut: self.df = self.df.Filter(cut)
+        self.filters = {None: self.df}
+
+    def column(self, expr):
+        # an expression is defined as a new column, once
+        if expr in self.columns: return expr
+        if expr not in self.expressions:
+            name = '_snd'+str(len(self.expressions))
+            self.df = self.df.Define(name, expr)
+            self.filters[None] = self.df
+            self.expressions[expr] = name
+        return self.expressions[expr]
+
+    def filtered(self, cut):
+        if cut not in self.filters: self.filters[cut] = self.filters[None].Filter(cut)
+        return self.filters[cut]
+
+def fillHists(config, threads=None):
+    """
+    Books all the histograms of config and runs the event loops of all samples together.
+    Returns {plot name: {sample: histogram}}, in the order of the config.
+    """
+    if threads is None: threads = config.get('threads', 0)
+    if threads == 1: ROOT.DisableImplicitMT()
+    else: ROOT.EnableImplicitMT(threads)
+    samples = {}
+    booked = {}
+    for sname, sample in config['samples'].items():
+        samples[sname] = _Sample(config['tree'], sample['files'], config.get('defines', {}),
+                                 list(config.get('cuts', []))+[sample.get('cut')])
+    # all the columns are defined before the filters of the plots are booked
+    for plot in config['plots']:
+        for sname in plot.get('samples', config['samples']):
+            node = samples[sname]
+            variables = plot['var'] if isinstance(plot['var'], list) else [plot['var']]
+            weight = plot.get('weight', config['samples'][sname].get('weight', config.get('weight')))
+            booked[(plot['name'], sname)] = [node.column(v) for v in variables] + ([node.column(weight)] if weight else [])
+    handles = {}
+    for plot in config['plots']:
+        for sname in plot.get('samples', config['samples']):
+            node = samples[sname].filtered(plot.get('cut'))
+            model = _model(sname+'_'+plot['name'], plot)
+            columns = booked[(plot['name'], sname)]
+            if isinstance(plot['var'], list): handles[(plot['name'], sname)] = node.Histo2D(model, *columns)
+            else: handles[(plot['name'], sname)] = node.Histo1D(model, *columns)
+    if len(samples) > 1 and hasattr(ROOT.RDF, 'RunGraphs'):
+        # the event loops of the samples run concurrently
+        ROOT.RDF.RunGraphs(list(handles.values()))
+    filled = {}
+    for (pname, sname), handle in handles.items():
+        hist = handle.GetValue().Clone(sname+'_'+pname)
+        hist.SetDirectory(0)
+        ROOT.SetOwnership(hist, True)
+        scale = config['samples'][sname].get('scale')
+        if scale: hist.Scale(scale)
+        filled.setdefault(pname, {})[sname] = hist
+    return filled
+
+def writeHists(filled, path):
+    """Writes the histograms of fillHists into a ROOT file, to be plotted again with -f."""
+    fout = ROOT.TFile.Open(path, 'RECREATE')
+    for hists in filled.values():
+        for hist in hists.values(): hist.Write()
+    fout.Close()
@@ -0,0 +1,141 @@
+"""
+    SNDindex.py    Sidecar index of the keys stored in a ROOT file
+
+    For each input file the list of keys (name, cycle, class, title, datime, from the key headers)
+    is stored next to it in a small JSON file, '.<filename>.sndidx.json', or in
+    ~/.cache/SNDstyle when the directory of the input file is not writable.
+    Axis titles and bin counts need the objects themselves: they are only read for --list
+    (getIndex(details=True)) and then kept in the index.
+    The index is trusted as long as size and mtime of the file do not change; when they do,
+    it is rebuilt and the entries of the keys with the same cycle and datime are kept.
+    Remote files (root://, https://...) have no index.
+"""
+import json
+import os
+
+
+INDEX_VERSION = 2
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'SNDstyle')
+# indices already read by this process, {abspath: index}
+_loaded = {}
+
+
+def isLocal(histfile):
+    """False for the urls (root://, https://...) opened by TFile::Open, which have no index."""
+    return '://' not in histfile
+
+def indexPaths(histfile):
+    import hashlib
+    histfile = os.path.abspath(histfile)
+    dirname, basename = os.path.split(histfile)
+    sidecar = os.path.join(dirname, '.'+basename+'.sndidx.json')
+    cached = os.path.join(CACHE_DIR, hashlib.sha1(histfile.encode()).hexdigest()+'.sndidx.json')
+    return sidecar, cached
+
+def _readIndex(histfile):
+    for path in indexPaths(histfile):
+        try:
+            with open(path) as fin:
+                return json.load(fin)
+        except (OSError, ValueError):
+            continue
+    return None
+
+def _writeIndex(histfile, index):
+    for path in indexPaths(histfile):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path+'.tmp'+str(os.getpid())
+            with open(tmp, 'w') as fout:
+                json.dump(index, fout)
+            os.replace(tmp, path)
+            return path
+        except OSError:
+            continue
+    print('### WARNING ###: could not write index for '+histfile)
+    return None
+
+def _keyEntry(key, previous):
+    import ROOT
+    entry = {'name': key.GetName(), 'cycle': key.GetCycle(), 'class': key.GetClassName(),
+             'title': key.GetTitle(), 'datime': key.GetDatime().Get()}
+    old = previous.get((entry['name'], entry['cycle']))
+    if old is not None and old['datime'] == entry['datime'] and old['class'] == entry['class']:
+        return old
+    # the key header only, the object is not read
+    cl = ROOT.TClass.GetClass(entry['class'])
+    entry['ishist'] = bool(cl) and cl.InheritsFrom('TH1')
+    return entry
+
+def _addDetails(f, keys):
+    # axis titles and bin counts of the histograms, read from the objects (once per key)
+    import ROOT
+    for entry in keys:
+        if 'nbinsx' in entry: continue
+        entry['xtitle'] = entry['ytitle'] = ''
+        entry['nbinsx'] = entry['nbinsy'] = 0
+        if not entry['ishist']: continue
+        hist = f.Get(entry['name']+';'+str(entry['cycle']))
+        if not hist: continue
+        hist.SetDirectory(0)
+        ROOT.SetOwnership(hist, True)
+        entry['xtitle'] = hist.GetXaxis().GetTitle()
+        entry['ytitle'] = hist.GetYaxis().GetTitle()
+        entry['nbinsx'] = hist.GetNbinsX()
+        entry['nbinsy'] = hist.GetNbinsY() if hist.GetDimension() > 1 else 0
+
+def _open(histfile):
+    import ROOT
+    f = ROOT.TFile.Open(histfile)
+    if not f or f.IsZombie():
+        raise Exception('ERROR: cannot open '+histfile)
+    return f
+
+def buildIndex(histfile, previous=None, details=False):
+    """Index of the keys of histfile, written next to it for local files."""
+    local = isLocal(histfile)
+    st = os.stat(histfile) if local else None
+    old = dict()
+    if previous is not None:
+        old = {(e['name'], e['cycle']): e for e in previous['keys']}
+    f = _open(histfile)
+    keys = [_keyEntry(key, old) for key in f.GetListOfKeys()]
+    if details: _addDetails(f, keys)
+    f.Close()
+    index = {'version': INDEX_VERSION, 'path': os.path.abspath(histfile) if local else histfile,
+             'size': st.st_size if local else None, 'mtime': st.st_mtime if local else None, 'keys': keys}
+    if local: _writeIndex(histfile, index)
+    return index
+
+def getIndex(histfile, details=False):
+    """
+    Returns the index of histfile, rebuilding it if the file changed; with details, also the
+    axis titles and bin counts. Remote files are indexed from scratch and nothing is stored.
+    """
+    if not isLocal(histfile):
+        return buildIndex(histfile, details=details)
+    path = os.path.abspath(histfile)
+    st = os.stat(histfile)
+    index = _loaded.get(path)
+    if index is None or index['size'] != st.st_size or index['mtime'] != st.st_mtime:
+        index = _readIndex(histfile)
+    if (index is None or index.get('version') != INDEX_VERSION
+            or index['size'] != st.st_size or index['mtime'] != st.st_mtime):
+        if index is not None and index.get('version') != INDEX_VERSION:
+            index = None
+        index = buildIndex(histfile, previous=index, details=details)
+    elif details and any('nbinsx' not in e for e in index['keys']):
+        f = _open(histfile)
+        _addDetails(f, index['keys'])
+        f.Close()
+        _writeIndex(histfile, index)
+    _loaded[path] = index
+    return index
+
+def latestKeys(index):
+    """Highest cycle of each key, in file order."""
+    entries = {}
+    for e in index['keys']:
+        if e['name'] not in entries or e['cycle'] > entries[e['name']]['cycle']:
+            entries[e['name']] = e
+    return entries
@@ -0,0 +1,121 @@
+"""
+    SNDjobs.py    Plot-job files and their planning
+
+    A job file (JSON, or YAML if PyYAML is installed) lists many plots at once:
+
+    {
+      "defaults": {"file": "histofile.root", "extratext": "Preliminary", "outpath": "plots_campaign/"},
+      "plots": [
+        {"type": "single", "hist": "Nscifi_hits", "scale": 2, "xrange": [0, 100], "logy": true},
+        {"type": "multi", "name": "hits_cmp", "hists": ["Nscifi_hits", {"file": "other.root", "hist": "Nscifi_hits"}],
+         "labels": ["run A", "run B"], "normalize": true},
+        {"type": "datamc", "name": "DATA-MC_hits", "hists": ["DATA_Nscifi_hits", "MC_Nscifi_hits"], "ratio": "ratio"},
+        {"type": "2d", "hist": "xy", "downsample": "sum"}
+      ]
+    }
+
+    The planner lists the distinct (file, key) inputs, so that each of them is read once whatever
+    the number of plots using it, and splits the plots into independent groups (connected components
+    of the plot-input graph) that can be drawn concurrently.
+"""
+import json
+import os
+
+
+PLOT_TYPES = ('single', 'multi', 'datamc', '2d')
+# job keys and the corresponding arguments of the draw functions
+_RENAMED = {'xrange': 'xaxrange', 'yrange': 'yaxrange', 'xtitle': 'xaxtitle', 'ytitle': 'yaxtitle',
+            'labels': 'labellist', 'name': 'figname'}
+_OPTIONS = {
+    'single': ('extratext', 'logy', 'rebin', 'scale', 'normalize', 'xaxrange', 'yaxrange', 'xaxtitle', 'yaxtitle',
+               'label', 'color', 'drawoptions', 'figname', 'formats', 'rangestats', 'adaptive', 'outpath'),
+    'multi': ('extra_text', 'logy', 'rebin', 'scale', 'normalize', 'xaxrange', 'xaxtitle', 'yaxtitle', 'labellist',
+              'drawoptions', 'figname', 'formats', 'rangestats', 'adaptive', 'outpath'),
+    'datamc': ('extra_text', 'logy', 'rebin', 'normalize', 'lumi', 'xaxrange', 'xaxtitle', 'yaxtitle', 'labellist',
+               'figname', 'formats', 'rangestats', 'adaptive', 'ratio', 'ratiofrac', 'outpath'),
+    '2d': ('extratext', 'xaxtitle', 'yaxtitle', 'label', 'drawoptions', 'formats', 'downsample', 'raster', 'outpath'),
+}
+
+
+def readJobs(path):
+    with open(path) as fin:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise Exception('ERROR: YAML job files require PyYAML, use JSON instead')
+            jobs = yaml.safe_load(fin)
+        else:
+            jobs = json.load(fin)
+    if 'plots' not in jobs: raise Exception('ERROR: "plots" missing in '+path)
+    # plots_<job file name>/ unless given
+    jobs.setdefault('defaults', {}).setdefault('outpath', 'plots_'+os.path.splitext(os.path.basename(path))[0]+'/')
+    return jobs
+
+def _inputs(plot, default):
+    # (file, key) of each histogram of the plot
+    hists = plot['hists'] if 'hists' in plot else [plot['hist']]
+    inputs = list()
+    for h in hists:
+        if isinstance(h, dict): inputs.append((h.get('file', default), h['hist']))
+        else: inputs.append((default, h))
+    for f, key in inputs:
+        if f is None: raise Exception('ERROR: no file given for "'+key+'"')
+    return inputs
+
+def _drawArgs(ptype, plot, defaults):
+    args = {}
+    for jobkey, value in list(defaults.items())+list(plot.items()):
+        if jobkey in ('type', 'file', 'hist', 'hists'): continue
+        key = _RENAMED.get(jobkey, jobkey)
+        # the multi and DATA-MC functions name it extra_text
+        if key == 'extratext' and ptype in ('multi', 'datamc'): key = 'extra_text'
+        if key not in _OPTIONS[ptype]:
+            # only the defaults may hold options of other plot types
+            if jobkey in plot: raise Exception('ERROR: option "'+jobkey+'" not supported by '+ptype+' plots')
+            continue
+        args[key] = value
+    return args
+
+def planJobs(jobs):
+    """
+    Returns (plots, inputs, components): each plot as {'type', 'inputs', 'args'}, the distinct inputs
+    as {file: [keys]} in order of first use, and the groups of plots (lists of indices) sharing inputs.
+    """
+    defaults = jobs.get('defaults', {})
+    plots = list()
+    inputs = {}
+    for plot in jobs['plots']:
+        ptype = plot.get('type', 'single')
+        if ptype not in PLOT_TYPES: raise Exception('ERROR: unknown plot type '+str(ptype))
+        pinputs = _inputs(plot, plot.get('file', defaults.get('file')))
+        for f, key in pinputs:
+            keys = inputs.setdefault(f, [])
+            if key not in keys: keys.append(key)
+        args = _drawArgs(ptype, plot, defaults)
+        if ptype in ('multi', 'datamc') and 'figname' not in args:
+            # one output per plot, named after its first histogram
+            args['figname'] = pinputs[0][1].replace('DATA', 'DATA-MC', 1) if ptype == 'datamc' else pinputs[0][1]+'_multi'
+        plots.append({'type': ptype, 'inputs': pinputs, 'args': args})
+    # union-find over the inputs: plots sharing an input end up in the same component
+    parent = {}
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    for plot in plots:
+        first = find(plot['inputs'][0])
+        for inp in plot['inputs'][1:]:
+            parent[find(inp)] = first
+    components = {}
+    for i, plot in enumerate(plots):
+        components.setdefault(find(plot['inputs'][0]), []).append(i)
+    return plots, inputs, list(components.values())
+
+def balance(components, nworkers):
+    """Deals the components to nworkers, largest first to the least loaded, as lists of plot indices."""
+    shares = [[] for i in range(nworkers)]
+    for component in sorted(components, key=len, reverse=True):
+        min(shares, key=len).extend(component)
+    return [sorted(share) for share in shares if share]
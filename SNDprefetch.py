@@ -0,0 +1,117 @@
+"""
+    SNDprefetch.py    Background reading of ROOT objects, overlapping file I/O with drawing
+
+    A Prefetcher reads a list of (file, key) objects in reader threads, up to depth objects ahead
+    of the consumer, and yields them in the original order: while the main thread draws an object
+    the next ones are already being read, which hides most of the latency of remote storage.
+    Opening files and reading keys run in small C++ helpers that release the GIL.
+    The time spent reading, waiting for the reader and drawing is summed in ioStats.
+"""
+import threading
+import time
+from collections import deque
+
+from SNDstyle import ROOT
+
+# seconds spent by the reader threads, waited by the consumer and spent between two objects
+ioStats = {'objects': 0, 'read': 0., 'wait': 0., 'draw': 0.}
+_lock = threading.Lock()
+_functions = None
+_CXX = '''
+TFile* SNDprefetchOpen(const char* path) { return TFile::Open(path); }
+TObject* SNDprefetchGet(TFile* f, const char* name) {
+    TObject* obj = f->Get(name);
+    if (obj && obj->InheritsFrom(TH1::Class())) ((TH1*)obj)->SetDirectory(nullptr);
+    return obj;
+}
+'''
+
+
+def reader():
+    """
+    (open, get) functions reading ROOT files without holding the GIL, for reader threads:
+    open(path) returns a TFile (null if it cannot be opened), get(file, name) the object,
+    detached from the file if it is a histogram. To be called once from the main thread first.
+    """
+    global _functions
+    if _functions is None:
+        ROOT.gInterpreter.Declare(_CXX)
+        functions = (ROOT.SNDprefetchOpen, ROOT.SNDprefetchGet)
+        for fn in functions: fn.__release_gil__ = True
+        _functions = functions
+    return _functions
+
+
+class Prefetcher(object):
+    """
+    Iterable over the objects of items, a list of (path, key name), as (path, name, object)
+    in the same order; object is None if it cannot be read. Histograms are detached from
+    their file. At most depth objects are read ahead, by workers threads.
+    """
+    def __init__(self, items, depth=4, workers=1):
+        from concurrent.futures import ThreadPoolExecutor
+        ROOT.EnableThreadSafety()
+        self.open, self.get = reader()
+        self.items = list(items)
+        self.depth = max(1, depth)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._local = threading.local()
+        # files open in the reader threads, one per thread
+        self._files = []
+
+    def _read(self, path, name):
+        start = time.time()
+        current = getattr(self._local, 'file', None)
+        if current is None or current[0] != path:
+            if current is not None: self._close(current[1])
+            f = self.open(path)
+            if f:
+                ROOT.SetOwnership(f, True)
+                with _lock: self._files.append(f)
+            current = self._local.file = (path, f)
+        f = current[1]
+        obj = self.get(f, name) if f and not f.IsZombie() else None
+        with _lock:
+            ioStats['objects'] += 1
+            ioStats['read'] += time.time()-start
+        return path, name, obj or None
+
+    def _close(self, f):
+        if not f: return
+        with _lock:
+            if f in self._files: self._files.remove(f)
+        f.Close()
+
+    def __iter__(self):
+        pending = deque()
+        try:
+            for item in self.items:
+                pending.append(self._pool.submit(self._read, *item))
+                if len(pending) > self.depth:
+                    for result in self._next(pending): yield result
+            while pending:
+                for result in self._next(pending): yield result
+        finally:
+            self.close()
+
+    def _next(self, pending):
+        start = time.time()
+        result = pending.popleft().result()
+        ioStats['wait'] += time.time()-start
+        start = time.time()
+        yield result
+        ioStats['draw'] += time.time()-start
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        with _lock:
+            files, self._files = self._files, []
+        for f in files: f.Close()
+
+
+def reportIO():
+    """Prints and resets ioStats."""
+    if ioStats['objects'] == 0: return
+    print('I/O: {} objects read in {:.2f} s in the background, {:.2f} s waiting for them, {:.2f} s drawing'.format(
+        ioStats['objects'], ioStats['read'], ioStats['wait'], ioStats['draw']))
+    ioStats.update(objects=0, read=0., wait=0., draw=0.)
@@ -0,0 +1,147 @@
+"""
+    SNDprofile.py    Time spent in each stage of a run
+
+    The plotter wraps its stages (opening files, reading keys, detaching, transforms, styling,
+    Draw, writeSND, saving) in stage() blocks, and the draw functions in profiled():
+
+        with SNDprofile.stage('read', name):
+            hist = f.Get(name)
+
+    Disabled (the default), stage() returns a shared do-nothing context manager and profiled()
+    checks a flag, so the hooks can stay in production. Enabled, each stage sums its calls, objects,
+    wall and CPU time, inclusive and without the nested stages (self), and the peak RSS of the
+    process at its end; the self times are also summed per histogram.
+"""
+import functools
+import json
+import resource
+import time
+
+enabled = False
+# {stage: [calls, objects, wall, self wall, cpu, self cpu, peak RSS in kB]}
+stages = {}
+# {histogram: {stage: self wall}}
+hists = {}
+# [[wall, cpu] of the nested stages] of the open stages
+_stack = []
+_start = None
+
+
+class _NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL = _NullStage()
+
+
+class _Stage(object):
+    __slots__ = ('name', 'hist', 'objects', 'wall', 'cpu')
+
+    def __init__(self, name, hist, objects):
+        self.name = name
+        self.hist = hist
+        self.objects = objects
+
+    def __enter__(self):
+        # the nested stages without a histogram are accounted to the one of the enclosing stage
+        if self.hist is None and _stack: self.hist = _stack[-1][2]
+        _stack.append([0., 0., self.hist])
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter()-self.wall
+        cpu = time.process_time()-self.cpu
+        nested = _stack.pop()
+        if _stack:
+            _stack[-1][0] += wall
+            _stack[-1][1] += cpu
+        stats = stages.setdefault(self.name, [0, 0, 0., 0., 0., 0., 0])
+        stats[0] += 1
+        stats[1] += self.objects
+        stats[2] += wall
+        stats[3] += wall-nested[0]
+        stats[4] += cpu
+        stats[5] += cpu-nested[1]
+        stats[6] = max(stats[6], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        if self.hist is not None:
+            row = hists.setdefault(self.hist, {})
+            row[self.name] = row.get(self.name, 0.)+wall-nested[0]
+        return False
+
+
+def stage(name, hist=None, objects=1):
+    """Context manager timing the stage name, for the histogram hist (a name) if given."""
+    if not enabled: return _NULL
+    return _Stage(name, hist, objects)
+
+def _histName(obj):
+    # name of the histogram, or of the first one of a list, drawn by a draw function
+    if isinstance(obj, (list, tuple)): obj = obj[0] if obj else None
+    return obj.GetName() if hasattr(obj, 'GetName') else None
+
+def profiled(fn):
+    """Decorator timing the calls of a draw function as a stage, for the histogram it draws."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not enabled: return fn(*args, **kwargs)
+        with _Stage(fn.__name__, _histName(args[0]) if args else None, 1):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def enable(on=True):
+    """Starts (or stops) profiling, from scratch."""
+    global enabled, _start
+    enabled = on
+    reset()
+    _start = (time.perf_counter(), time.process_time()) if on else None
+
+def reset():
+    stages.clear()
+    hists.clear()
+    del _stack[:]
+
+def collect():
+    """The profile of this process, to be merged into the one of another (e.g. from a worker)."""
+    return {'stages': dict(stages), 'hists': dict(hists)}
+
+def merge(profile):
+    for name, stats in profile['stages'].items():
+        total = stages.setdefault(name, [0, 0, 0., 0., 0., 0., 0])
+        for i in range(6): total[i] += stats[i]
+        total[6] = max(total[6], stats[6])
+    for hname, row in profile['hists'].items():
+        total = hists.setdefault(hname, {})
+        for name, wall in row.items(): total[name] = total.get(name, 0.)+wall
+
+def report(path=None, top=10):
+    """Prints the stages by self time and the slowest histograms, and writes the full profile as JSON into path."""
+    if not enabled: return
+    wall = time.perf_counter()-_start[0]
+    cpu = time.process_time()-_start[1]
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+    print('Profile: {:.2f} s wall, {:.2f} s CPU (this process), peak RSS {:.0f} MB'.format(wall, cpu, peak))
+    print('{:<20} {:>7} {:>8} {:>9} {:>9} {:>9} {:>9}'.format('stage', 'calls', 'objects', 'wall [s]', 'self [s]',
+                                                              'cpu [s]', 'RSS [MB]'))
+    for name, s in sorted(stages.items(), key=lambda item: item[1][3], reverse=True):
+        print('{:<20} {:>7} {:>8} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.0f}'.format(name, s[0], s[1], s[2], s[3], s[4], s[6]/1024.))
+    rows = sorted(((sum(row.values()), hname) for hname, row in hists.items()), reverse=True)
+    if rows:
+        print('Slowest histograms:')
+        for total, hname in rows[:top]:
+            stagetimes = ', '.join('{} {:.3f}'.format(name, t) for name, t in sorted(hists[hname].items(), key=lambda item: -item[1]))
+            print('  {:<30} {:.3f} s ({})'.format(hname, total, stagetimes))
+    if path:
+        profile = {
+            'wall': wall, 'cpu': cpu, 'peak_rss_mb': peak,
+            'stages': {name: dict(zip(('calls', 'objects', 'wall', 'self_wall', 'cpu', 'self_cpu'), s[:6]),
+                                  peak_rss_mb=s[6]/1024.) for name, s in stages.items()},
+            'hists': [dict(hist=hname, total=total, stages=hists[hname]) for total, hname in rows],
+        }
+        with open(path, 'w') as fout:
+            json.dump(profile, fout, indent=1)
+        print('Profile written to', path)
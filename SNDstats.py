@@ -0,0 +1,367 @@
+"""
+    SNDstats.py    Histogram statistics computed on NumPy views of the ROOT bin arrays
+
+    Bin contents, squared errors and bin edges of a TH1 are read as zero-copy NumPy views,
+    so that the numbers shown in the legends (entries, integral, mean, std dev), also restricted
+    to an x range, cost a handful of PyROOT calls per histogram instead of one per quantity or bin.
+    Results are cached per histogram and recomputed when its content changes (e.g. after Scale).
+    NumPy is optional: without it the same numbers are taken from the TH1 methods.
+"""
+from array import array
+
+from SNDstyle import ROOT
+
+# numpy dtype of the bin array, from the last letter of the histogram class (TH1D, TH2F, ...)
+_DTYPES = {'D': 'f8', 'F': 'f4', 'I': 'i4', 'S': 'i2', 'C': 'i1', 'L': 'i8'}
+_MAXCACHE = 10000
+# {(address, x range): (content key, stats)}
+_cache = {}
+# {(names, relerr, mincount): (content keys, edges)}, one entry per set of histogram names
+_edgeCache = {}
+_np = False
+
+
+def numpy():
+    # numpy module, or None if it is not installed; imported at the first use
+    global _np
+    if _np is False:
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        _np = np
+    return _np
+
+def _view(buf, dtype, count):
+    np = numpy()
+    buf.reshape((count,))
+    return np.frombuffer(buf, dtype=dtype, count=count)
+
+def contentView(hist):
+    """Bin contents (under/overflow included) as a NumPy view, None if not available."""
+    cname = hist.IsA().GetName()
+    dtype = _DTYPES.get(cname[-1])
+    if numpy() is None or dtype is None or cname.startswith('TProfile'):
+        return None
+    try:
+        return _view(hist.GetArray(), dtype, hist.GetSize())
+    except Exception:
+        return None
+
+def sumw2View(hist):
+    """Squared bin errors as a NumPy view, or the contents for histograms without Sumw2."""
+    if hist.GetSumw2N() == 0:
+        return numpy().abs(contentView(hist)).astype('f8')
+    return _view(hist.GetSumw2().GetArray(), 'f8', hist.GetSize())
+
+def binEdges(axis):
+    np = numpy()
+    nbins = axis.GetNbins()
+    xbins = axis.GetXbins()
+    if xbins.GetSize() == 0:
+        return np.linspace(axis.GetXmin(), axis.GetXmax(), nbins+1)
+    return _view(xbins.GetArray(), 'f8', nbins+1)
+
+def rangeBins(edges, xrange):
+    # first and last bin of xrange, as TAxis::SetRangeUser
+    np = numpy()
+    nbins = len(edges)-1
+    first = max(1, int(np.searchsorted(edges, float(xrange[0]), side='right')))
+    last = min(nbins, int(np.searchsorted(edges, float(xrange[1]), side='right')))
+    if last >= 1 and edges[last-1] >= float(xrange[1]): last -= 1
+    return first, max(first, last)
+
+def _computeStats(hist, content, xrange):
+    np = numpy()
+    nbins = hist.GetNbinsX()
+    if xrange:
+        edges = binEdges(hist.GetXaxis())
+        first, last = rangeBins(edges, xrange)
+        w = content[first:last+1].astype('f8')
+        centers = 0.5*(edges[first-1:last]+edges[first:last+1])
+        sumw = w.sum()
+        mean = (w*centers).sum()/sumw if sumw != 0 else 0.
+        var = (w*centers*centers).sum()/sumw - mean*mean if sumw != 0 else 0.
+        return {'entries': hist.GetEntries(), 'integral': float(sumw),
+                'mean': float(mean), 'stddev': float(np.sqrt(abs(var)))}
+    # same numbers as TH1::GetMean/GetStdDev, from the (unbinned) statistics kept by ROOT
+    stats = array('d', [0.]*13)
+    hist.GetStats(stats)
+    mean = stats[2]/stats[0] if stats[0] != 0 else 0.
+    var = stats[3]/stats[0] - mean*mean if stats[0] != 0 else 0.
+    return {'entries': hist.GetEntries(), 'integral': float(content[1:nbins+1].sum()),
+            'mean': mean, 'stddev': float(np.sqrt(abs(var)))}
+
+def _rootStats(hist, xrange):
+    xax = hist.GetXaxis()
+    if xrange:
+        first, last = xax.GetFirst(), xax.GetLast()
+        xax.SetRangeUser(float(xrange[0]), float(xrange[1]))
+    result = {'entries': hist.GetEntries(), 'integral': hist.Integral(),
+              'mean': hist.GetMean(), 'stddev': hist.GetStdDev()}
+    if xrange: xax.SetRange(first, last)
+    return result
+
+def _contentKey(hist):
+    # changes when hist is refilled, scaled or rebinned, or when another histogram takes its address,
+    # without a pass over the bins: the sums of weights kept by ROOT
+    stats = array('d', [0.]*13)
+    hist.GetStats(stats)
+    xax = hist.GetXaxis()
+    return (hist.GetName(), hist.GetEntries(), xax.GetNbins(), xax.GetXmin(), xax.GetXmax(),
+            xax.GetXbins().GetSize(), tuple(stats))
+
+def histStats(hist, xrange=None):
+    """
+    Entries, integral, mean and std dev of a 1D histogram, in xrange if given, as a dict.
+    Cached per histogram and x range.
+    """
+    content = contentView(hist)
+    if content is None:
+        return _rootStats(hist, xrange)
+    key = (ROOT.addressof(hist), tuple(float(x) for x in xrange) if xrange else None)
+    token = _contentKey(hist)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    result = _computeStats(hist, content, xrange)
+    if len(_cache) > _MAXCACHE: _cache.clear()
+    _cache[key] = (token, result)
+    return result
+
+def clearCache():
+    """Frees the cached statistics and bin edges."""
+    _cache.clear()
+    _edgeCache.clear()
+
+def sameBinning(h1, h2):
+    """True if h1 and h2 have the same dimension and the same bin edges on every axis."""
+    if h1.GetDimension() != h2.GetDimension(): return False
+    for a1, a2 in list(zip((h1.GetXaxis(), h1.GetYaxis(), h1.GetZaxis()), (h2.GetXaxis(), h2.GetYaxis(), h2.GetZaxis())))[:h1.GetDimension()]:
+        if (a1.GetNbins(), a1.GetXmin(), a1.GetXmax()) != (a2.GetNbins(), a2.GetXmin(), a2.GetXmax()): return False
+        x1, x2 = a1.GetXbins(), a2.GetXbins()
+        if x1.GetSize() != x2.GetSize() or any(x1.At(i) != x2.At(i) for i in range(x1.GetSize())): return False
+    return True
+
+def batchStats(hists, xrange=None):
+    """histStats of all the histograms of a plot (or of a file), in the same order."""
+    return [histStats(hist, xrange) for hist in hists]
+
+def ratioArrays(num, numw2, den, denw2, mode='ratio'):
+    """
+    Bin-by-bin num/den with uncorrelated errors (mode='ratio') or (num-den)/sigma (mode='pull'),
+    and the mask of the bins where it is defined; the others (empty denominator, null sigma) are
+    left at 0 with 0 error.
+    """
+    np = numpy()
+    num = np.asarray(num, dtype='f8'); den = np.asarray(den, dtype='f8')
+    values = np.zeros_like(num)
+    errors = np.zeros_like(num)
+    if mode == 'pull':
+        sigma = np.sqrt(np.asarray(numw2, dtype='f8')+np.asarray(denw2, dtype='f8'))
+        ok = sigma > 0
+        values[ok] = (num[ok]-den[ok])/sigma[ok]
+        errors[ok] = 1.
+        return values, errors, ok
+    ok = den != 0
+    values[ok] = num[ok]/den[ok]
+    errors[ok] = np.sqrt(numw2[ok]/den[ok]**2 + num[ok]**2*denw2[ok]/den[ok]**4)
+    return values, errors, ok
+
+def ratioHist(data, mclist, mode='ratio'):
+    """
+    Data/MC ratio or pull histogram, with the binning of data (the MC histograms are summed), and
+    the list of the bins where it is defined: the bins without MC (without data and MC for the pulls)
+    are left unfilled.
+    """
+    ratio = data.Clone(data.GetName()+'_'+mode)
+    ratio.SetDirectory(0)
+    if ratio.GetSumw2N() == 0: ratio.Sumw2()
+    nbins = data.GetSize()
+    if numpy() is None or contentView(data) is None or any(contentView(h) is None for h in mclist):
+        mc = mclist[0].Clone(mclist[0].GetName()+'_sum')
+        mc.SetDirectory(0)
+        for h in mclist[1:]: mc.Add(h)
+        if mode == 'pull':
+            defined = [i for i in range(nbins) if data.GetBinError(i) > 0 or mc.GetBinError(i) > 0]
+            for i in range(nbins):
+                sigma = (data.GetBinError(i)**2 + mc.GetBinError(i)**2)**0.5
+                ratio.SetBinContent(i, (data.GetBinContent(i)-mc.GetBinContent(i))/sigma if sigma > 0 else 0.)
+                ratio.SetBinError(i, 1. if sigma > 0 else 0.)
+        else:
+            defined = [i for i in range(nbins) if mc.GetBinContent(i) != 0]
+            ratio.Divide(mc)
+        return ratio, defined
+    mc = sum(contentView(h).astype('f8') for h in mclist)
+    mcw2 = sum(sumw2View(h) for h in mclist)
+    values, errors, ok = ratioArrays(contentView(data), sumw2View(data), mc, mcw2, mode)
+    ratio.SetContent(values)
+    ratio.SetError(errors)
+    ratio.SetEntries(data.GetEntries())
+    return ratio, [int(i) for i in numpy().flatnonzero(ok)]
+
+def ratioGraph(ratio, defined):
+    """Points with errors of the defined bins of ratio (see ratioHist), with its marker and line attributes."""
+    xax = ratio.GetXaxis()
+    bins = [i for i in defined if 1 <= i <= ratio.GetNbinsX()]
+    graph = ROOT.TGraphErrors(len(bins))
+    for n, i in enumerate(bins):
+        graph.SetPoint(n, xax.GetBinCenter(i), ratio.GetBinContent(i))
+        graph.SetPointError(n, 0.5*xax.GetBinWidth(i), ratio.GetBinError(i))
+    ROOT.TAttMarker.Copy(ratio, graph)
+    ROOT.TAttLine.Copy(ratio, graph)
+    return graph
+
+def kolmogorovProb(z):
+    """Kolmogorov distribution survival function, vectorized (as TMath::KolmogorovProb)."""
+    np = numpy()
+    z = np.atleast_1d(np.asarray(z, dtype='f8'))
+    k = np.arange(1, 101).reshape(1, -1)
+    terms = 2.*(-1.)**(k-1)*np.exp(-2.*k*k*z.reshape(-1, 1)**2)
+    prob = np.clip(terms.sum(axis=1), 0., 1.)
+    return np.where(z < 0.2, 1., prob)
+
+def compatibility(data, dataw2, mc, mcw2):
+    """
+    Shape compatibility of pairs of histograms with the same binning: one pair per row of the
+    (npairs, nbins) arrays of contents and squared errors, in-range bins only.
+    The distributions are normalized to unit area; returns a dict of arrays with chi2, ndf,
+    chi2/ndf, the Kolmogorov distance and its probability.
+    """
+    np = numpy()
+    data = np.asarray(data, dtype='f8'); mc = np.asarray(mc, dtype='f8')
+    dataw2 = np.asarray(dataw2, dtype='f8'); mcw2 = np.asarray(mcw2, dtype='f8')
+    nd = data.sum(axis=1, keepdims=True)
+    nm = mc.sum(axis=1, keepdims=True)
+    sd = np.where(nd != 0, nd, 1.)
+    sm = np.where(nm != 0, nm, 1.)
+    d = data/sd
+    m = mc/sm
+    var = dataw2/sd**2 + mcw2/sm**2
+    used = var > 0
+    chi2 = ((d-m)**2/np.where(used, var, 1.)*used).sum(axis=1)
+    ndf = used.sum(axis=1)-1
+    ks = np.abs(np.cumsum(d, axis=1)-np.cumsum(m, axis=1)).max(axis=1)
+    # effective number of entries of weighted histograms
+    ed = nd[:, 0]**2/np.where(dataw2.sum(axis=1) > 0, dataw2.sum(axis=1), 1.)
+    em = nm[:, 0]**2/np.where(mcw2.sum(axis=1) > 0, mcw2.sum(axis=1), 1.)
+    neff = np.sqrt(ed*em/np.where(ed+em > 0, ed+em, 1.))
+    ksprob = kolmogorovProb((neff+0.12+0.11/np.where(neff > 0, neff, 1.))*ks)
+    empty = (nd[:, 0] == 0) | (nm[:, 0] == 0)
+    return {'chi2': chi2, 'ndf': ndf, 'chi2ndf': np.where(ndf > 0, chi2/np.where(ndf > 0, ndf, 1), 0.),
+            'ks': np.where(empty, 1., ks), 'ksprob': np.where(empty, 0., ksprob)}
+
+def reduceBins(content, fy, fx, mode='sum'):
+    """
+    Merges blocks of fy x fx bins of a 2D (ny, nx) array with sum, mean or max;
+    incomplete blocks at the upper edges are merged as well.
+    """
+    np = numpy()
+    ny, nx = content.shape
+    NY, NX = -(-ny//fy), -(-nx//fx)
+    fill = -np.inf if mode == 'max' else 0.
+    padded = np.full((NY*fy, NX*fx), fill)
+    padded[:ny, :nx] = content
+    blocks = padded.reshape(NY, fy, NX, fx)
+    if mode == 'max':
+        return blocks.max(axis=(1, 3))
+    reduced = blocks.sum(axis=(1, 3))
+    if mode == 'mean':
+        counts = np.zeros((NY*fy, NX*fx))
+        counts[:ny, :nx] = 1.
+        reduced = reduced/counts.reshape(NY, fy, NX, fx).sum(axis=(1, 3))
+    return reduced
+
+def downsample2d(hist, maxnx, maxny, mode='sum'):
+    """
+    TH2D with at most maxnx x maxny bins (e.g. the pixels of the frame) merging the bins of hist
+    with sum, mean or max; hist itself if it is already small enough or not supported.
+    """
+    np = numpy()
+    nx, ny = hist.GetNbinsX(), hist.GetNbinsY()
+    fx, fy = max(1, -(-nx//max(1, int(maxnx)))), max(1, -(-ny//max(1, int(maxny))))
+    content = contentView(hist)
+    if (fx == 1 and fy == 1) or content is None:
+        return hist
+    inner = content.reshape(ny+2, nx+2)[1:ny+1, 1:nx+1]
+    reduced = reduceBins(inner, fy, fx, mode)
+    NY, NX = reduced.shape
+    xedges, yedges = binEdges(hist.GetXaxis()), binEdges(hist.GetYaxis())
+    xedges = np.append(xedges[:-1:fx], xedges[-1])
+    yedges = np.append(yedges[:-1:fy], yedges[-1])
+    # not registered in gROOT, where it would replace the original of the same name
+    adddir = ROOT.TH1.AddDirectoryStatus()
+    ROOT.TH1.AddDirectory(False)
+    small = ROOT.TH2D(hist.GetName()+'_downsampled', hist.GetTitle(), NX, xedges, NY, yedges)
+    ROOT.TH1.AddDirectory(adddir)
+    ROOT.SetOwnership(small, True)
+    full = np.zeros((NY+2, NX+2))
+    full[1:NY+1, 1:NX+1] = reduced
+    small.SetContent(full.ravel())
+    small.SetEntries(hist.GetEntries())
+    for src, dst in ((hist.GetXaxis(), small.GetXaxis()), (hist.GetYaxis(), small.GetYaxis()), (hist.GetZaxis(), small.GetZaxis())):
+        dst.SetTitle(src.GetTitle())
+    small.SetName(hist.GetName())
+    return small
+
+def adaptiveEdges(hists, relerr=None, mincount=None):
+    """
+    Variable bin edges for histograms with the same binning: bins are merged from the left until
+    each merged bin holds at least mincount effective entries and has a relative statistical
+    error below relerr (either criterion can be left out), in every histogram; the leftover
+    bins join the last merged bin. Cached per histogram name(s), recomputed when the histograms
+    change; None without numpy.
+    """
+    if relerr is None and mincount is None:
+        raise Exception('ERROR: adaptive rebinning needs relerr or mincount')
+    if relerr is not None and relerr <= 0: raise Exception('ERROR: relerr must be > 0, not '+str(relerr))
+    if mincount is not None and mincount <= 0: raise Exception('ERROR: mincount must be > 0, not '+str(mincount))
+    np = numpy()
+    if np is None or any(contentView(h) is None for h in hists):
+        print('### WARNING ###: adaptive rebinning requires numpy and TH1D/F/I/S/C histograms, skipping.')
+        return None
+    key = (tuple(h.GetName() for h in hists), relerr, mincount)
+    token = tuple(_contentKey(h) for h in hists)
+    cached = _edgeCache.get(key)
+    if cached is not None and cached[0] == token:
+        return cached[1]
+    axis = hists[0].GetXaxis()
+    nbins = axis.GetNbins()
+    # a relative error relerr needs 1/relerr^2 effective entries: both criteria hold for the larger target
+    target = max(float(mincount or 0.), 1./float(relerr)**2 if relerr is not None else 0.)
+    # effective entries per bin, w^2/sumw2 (= entries for unweighted histograms), the lowest over hists
+    counts = None
+    for hist in hists:
+        w = contentView(hist)[1:nbins+1].astype('f8')
+        w2 = sumw2View(hist)[1:nbins+1]
+        neff = np.where(w2 > 0, w*w/np.where(w2 > 0, w2, 1.), 0.)
+        counts = neff if counts is None else np.minimum(counts, neff)
+    cumulative = np.concatenate(([0.], np.cumsum(counts)))
+    indices = [0]
+    while True:
+        # first edge where the merged bin reaches the target
+        last = int(np.searchsorted(cumulative, cumulative[indices[-1]]+target, side='left'))
+        if last > nbins: break
+        indices.append(last)
+    if len(indices) == 1: indices.append(nbins)
+    else: indices[-1] = nbins
+    edges = np.ascontiguousarray(binEdges(axis)[indices], dtype='f8')
+    if len(_edgeCache) > _MAXCACHE: _edgeCache.clear()
+    _edgeCache[key] = (token, edges)
+    return edges
+
+def rebinVariable(hist, edges):
+    """New histogram with the given bin edges (the name is kept), hist is left untouched."""
+    newhist = hist.Rebin(len(edges)-1, hist.GetName()+'_varbins', edges)
+    # detached from gROOT, where the original has the same name
+    newhist.SetDirectory(0)
+    ROOT.SetOwnership(newhist, True)
+    newhist.SetName(hist.GetName())
+    return newhist
+
+def adaptiveRebin(hists, relerr=None, mincount=None):
+    """Rebins all hists with the same adaptiveEdges; hists unchanged without numpy."""
+    edges = adaptiveEdges(hists, relerr, mincount)
+    if edges is None:
+        return list(hists)
+    return [rebinVariable(hist, edges) for hist in hists]
@@ -1,109 +1,324 @@
-import ROOT
-
-
-def init_style():
+import importlib
+import os
+from collections import OrderedDict
+
+
+class _LazyModule(object):
+    # imports the module at the first attribute access: importing SNDstyle does not start ROOT
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+ROOT = _LazyModule('ROOT')
+
+# to be increased at every change of the style, outputs drawn with an older one are redrawn in incremental mode
+STYLE_VERSION = 2
+
+# the named styles: SND is the base one, the others add the fonts (precision 3, sizes in pixels),
+# axis title offsets and pad margins of each kind of plot, as (setter, arguments)
+_PLOTSETTINGS = (('SetPadLeftMargin', 0.15), ('SetPadRightMargin', 0.05), ('SetPadTopMargin', 0.05),
+                 ('SetPadBottomMargin', 0.15), ('SetLabelFont', 43, 'XYZ'), ('SetTitleFont', 63, 'XYZ'),
+                 ('SetTitleXOffset', 1.2))
+STYLES = {
+    'SND': (),
+    'SND-single': _PLOTSETTINGS+(('SetLabelSize', 15, 'XYZ'), ('SetTitleSize', 18, 'XYZ'), ('SetTitleYOffset', 1.5),
+                                 ('SetNdivisions', 408, 'Y')),
+    'SND-multi': _PLOTSETTINGS+(('SetLabelSize', 22, 'XYZ'), ('SetTitleSize', 26, 'XYZ'), ('SetTitleYOffset', 1.2)),
+    'SND-2D': _PLOTSETTINGS+(('SetLabelSize', 22, 'XYZ'), ('SetTitleSize', 26, 'XYZ'), ('SetTitleYOffset', 1.2),
+                             ('SetNdivisions', 408, 'Y')),
+    'SND-paper': _PLOTSETTINGS+(('SetLabelSize', 26, 'XYZ'), ('SetTitleSize', 30, 'XYZ'), ('SetTitleYOffset', 1.3),
+                                ('SetHistLineWidth', 3)),
+}
+# whether the styles are built, the current one and the one used for all plots (see forceStyle)
+_built = False
+_current = None
+forcedStyle = None
+# writeSND: {key: text primitives}, the logo image file and the image once loaded
+_overlays = OrderedDict()
+_MAXOVERLAYS = 256
+logoFile = None
+_logo = None
+
+
+def _baseStyle(style):
+    # the settings shared by all the SND styles
 
     #for the canvas:
-    ROOT.gStyle.SetCanvasBorderMode(0)
-    ROOT.gStyle.SetCanvasColor(ROOT.kWhite)
-    ROOT.gStyle.SetCanvasDefH(600) #Height of canvas
-    ROOT.gStyle.SetCanvasDefW(600) #Width of canvas
-    ROOT.gStyle.SetCanvasDefX(10)   #Position on screen
-    ROOT.gStyle.SetCanvasDefY(10)
-
-
-    ROOT.gStyle.SetPadBorderMode(0)
-    ROOT.gStyle.SetPadColor(ROOT.kWhite)
-    ROOT.gStyle.SetPadGridX(False)
-    ROOT.gStyle.SetPadGridY(False)
-    ROOT.gStyle.SetGridColor(0)
-    ROOT.gStyle.SetGridStyle(3)
-    ROOT.gStyle.SetGridWidth(1)
+    style.SetCanvasBorderMode(0)
+    style.SetCanvasColor(ROOT.kWhite)
+    style.SetCanvasDefH(600) #Height of canvas
+    style.SetCanvasDefW(600) #Width of canvas
+    style.SetCanvasDefX(10)   #Position on screen
+    style.SetCanvasDefY(10)
+
+
+    style.SetPadBorderMode(0)
+    style.SetPadColor(ROOT.kWhite)
+    style.SetPadGridX(False)
+    style.SetPadGridY(False)
+    style.SetGridColor(0)
+    style.SetGridStyle(3)
+    style.SetGridWidth(1)
 
     #For the frame:
-    ROOT.gStyle.SetFrameBorderMode(0)
-    ROOT.gStyle.SetFrameBorderSize(1)
-    ROOT.gStyle.SetFrameFillColor(0)
-    ROOT.gStyle.SetFrameFillStyle(0)
-    ROOT.gStyle.SetFrameLineColor(1)
-    ROOT.gStyle.SetFrameLineStyle(1)
-    ROOT.gStyle.SetFrameLineWidth(3)
+    style.SetFrameBorderMode(0)
+    style.SetFrameBorderSize(1)
+    style.SetFrameFillColor(0)
+    style.SetFrameFillStyle(0)
+    style.SetFrameLineColor(1)
+    style.SetFrameLineStyle(1)
+    style.SetFrameLineWidth(3)
 
     #For the histo:
-    ROOT.gStyle.SetHistLineColor(ROOT.kBlue)
-    ROOT.gStyle.SetHistLineStyle(0)
-    ROOT.gStyle.SetHistLineWidth(2)
+    style.SetHistLineColor(ROOT.kBlue)
+    style.SetHistLineStyle(0)
+    style.SetHistLineWidth(2)
 
 
-    ROOT.gStyle.SetEndErrorSize(2)
+    style.SetEndErrorSize(2)
 
 
-    ROOT.gStyle.SetMarkerStyle(20)
+    style.SetMarkerStyle(20)
 
     #For the fit/function:
-    ROOT.gStyle.SetOptFit(1)
-    ROOT.gStyle.SetFitFormat("5.4g")
-    ROOT.gStyle.SetFuncColor(2)
-    ROOT.gStyle.SetFuncStyle(1)
-    ROOT.gStyle.SetFuncWidth(1)
+    style.SetOptFit(1)
+    style.SetFitFormat("5.4g")
+    style.SetFuncColor(2)
+    style.SetFuncStyle(1)
+    style.SetFuncWidth(1)
 
     #For the date:
-    ROOT.gStyle.SetOptDate(0)
+    style.SetOptDate(0)
 
 
     # For the statistics box:
-    ROOT.gStyle.SetOptFile(0)
-    ROOT.gStyle.SetOptStat(0) # To display the mean and RMS:   SetOptStat("mr")
-    ROOT.gStyle.SetStatColor(ROOT.kWhite)
-    ROOT.gStyle.SetStatFont(42)
-    ROOT.gStyle.SetStatFontSize(0.025)
-    ROOT.gStyle.SetStatTextColor(1)
-    ROOT.gStyle.SetStatFormat("6.4g")
-    ROOT.gStyle.SetStatBorderSize(1)
-    ROOT.gStyle.SetStatH(0.1)
-    ROOT.gStyle.SetStatW(0.15)
+    style.SetOptFile(0)
+    style.SetOptStat(0) # To display the mean and RMS:   SetOptStat("mr")
+    style.SetStatColor(ROOT.kWhite)
+    style.SetStatFont(42)
+    style.SetStatFontSize(0.025)
+    style.SetStatTextColor(1)
+    style.SetStatFormat("6.4g")
+    style.SetStatBorderSize(1)
+    style.SetStatH(0.1)
+    style.SetStatW(0.15)
 
     # Margins:
-    #ROOT.gStyle.SetPadTopMargin(0.05)
-    #ROOT.gStyle.SetPadBottomMargin(0.15)
-    #ROOT.gStyle.SetPadLeftMargin(0.15)
-    #ROOT.gStyle.SetPadRightMargin(0.05)
+    #style.SetPadTopMargin(0.05)
+    #style.SetPadBottomMargin(0.15)
+    #style.SetPadLeftMargin(0.15)
+    #style.SetPadRightMargin(0.05)
 
     # For the Global title:
 
-    ROOT.gStyle.SetOptTitle(0)
-    ROOT.gStyle.SetTitleFont(42)
-    ROOT.gStyle.SetTitleColor(1)
-    ROOT.gStyle.SetTitleTextColor(1)
-    ROOT.gStyle.SetTitleFillColor(10)
-    ROOT.gStyle.SetTitleFontSize(0.05)
+    style.SetOptTitle(0)
+    style.SetTitleFont(42)
+    style.SetTitleColor(1)
+    style.SetTitleTextColor(1)
+    style.SetTitleFillColor(10)
+    style.SetTitleFontSize(0.05)
 
 
     # For the axis titles:
     
-    ROOT.gStyle.SetTitleColor(1, "XYZ")
-    ROOT.gStyle.SetTitleFont(42, "XYZ")
-    ROOT.gStyle.SetTitleSize(0.04, "XYZ")
-    ROOT.gStyle.SetTitleXOffset(0.8)
-    ROOT.gStyle.SetTitleYOffset(1.2)
+    style.SetTitleColor(1, "XYZ")
+    style.SetTitleFont(42, "XYZ")
+    style.SetTitleSize(0.04, "XYZ")
+    style.SetTitleXOffset(0.8)
+    style.SetTitleYOffset(1.2)
     
 
     # For the axis labels:
     
-    ROOT.gStyle.SetLabelColor(1, "XYZ")
-    ROOT.gStyle.SetLabelFont(42, "XYZ")
-    ROOT.gStyle.SetLabelOffset(0.007, "XYZ")
-    ROOT.gStyle.SetLabelSize(0.04, "XYZ")
+    style.SetLabelColor(1, "XYZ")
+    style.SetLabelFont(42, "XYZ")
+    style.SetLabelOffset(0.007, "XYZ")
+    style.SetLabelSize(0.04, "XYZ")
     
 
     # For the axis:
 
-    ROOT.gStyle.SetAxisColor(1, "XYZ")
-    ROOT.gStyle.SetStripDecimals(True)
-    ROOT.gStyle.SetTickLength(0.03, "XYZ")
-    ROOT.gStyle.SetNdivisions(510, "XYZ")
-    ROOT.gStyle.SetPadTickX(1)  # To get tick marks on the opposite side of the frame
-    ROOT.gStyle.SetPadTickY(1)
+    style.SetAxisColor(1, "XYZ")
+    style.SetStripDecimals(True)
+    style.SetTickLength(0.03, "XYZ")
+    style.SetNdivisions(510, "XYZ")
+    style.SetPadTickX(1)  # To get tick marks on the opposite side of the frame
+    style.SetPadTickY(1)
+
+def _readStyles(cachefile):
+    # the styles of a cache file written with the current STYLE_VERSION, None otherwise
+    f = ROOT.TFile.Open(cachefile)
+    if not f or f.IsZombie(): return None
+    version = f.Get('STYLE_VERSION')
+    styles = [f.Get(name) for name in STYLES] if version and version.GetTitle() == str(STYLE_VERSION) else []
+    f.Close()
+    if not styles or not all(styles): return None
+    return styles
+
+def buildStyles(cachefile=None):
+    """
+    Builds the named styles of STYLES once and registers them in gROOT, to be switched with useStyle.
+    With cachefile, they are read from this ROOT file, or built and written there if it does not
+    exist or was written with another STYLE_VERSION.
+    """
+    global _built
+    if _built: return
+    styles = _readStyles(cachefile) if cachefile and os.path.exists(cachefile) else None
+    if styles is not None:
+        for style in styles:
+            ROOT.SetOwnership(style, False)
+            ROOT.gROOT.GetListOfStyles().Add(style)
+    else:
+        styles = list()
+        for name, settings in STYLES.items():
+            # registered in (and owned by) gROOT
+            style = ROOT.TStyle(name, name)
+            ROOT.SetOwnership(style, False)
+            _baseStyle(style)
+            for setting in settings: getattr(style, setting[0])(*setting[1:])
+            styles.append(style)
+        if cachefile:
+            fout = ROOT.TFile.Open(cachefile, 'RECREATE')
+            for style in styles: style.Write(style.GetName())
+            ROOT.TNamed('STYLE_VERSION', str(STYLE_VERSION)).Write()
+            fout.Close()
+    _built = True
+
+def useStyle(name, *objects):
+    """
+    Makes the named style (or the one given to forceStyle) the current one, and applies it to
+    objects (canvases, pads) with UseCurrentStyle; histograms are styled with styleAxes.
+    """
+    global _current
+    name = forcedStyle or name
+    if name != _current:
+        buildStyles()
+        ROOT.gROOT.SetStyle(name)
+        _current = name
+    for obj in objects: obj.UseCurrentStyle()
+
+def styleAxes(hist):
+    """
+    Fonts, sizes, title offsets and divisions of the current style on the axes of hist. Unlike
+    TH1::UseCurrentStyle, the line, fill and marker attributes of hist are kept, and so are the
+    label offsets and tick lengths of its axes.
+    """
+    for axis, name in ((hist.GetXaxis(), 'X'), (hist.GetYaxis(), 'Y'), (hist.GetZaxis(), 'Z')):
+        # ResetAttAxis also resets them
+        labeloffset, ticklength = axis.GetLabelOffset(), axis.GetTickLength()
+        axis.ResetAttAxis(name)
+        axis.SetLabelOffset(labeloffset)
+        axis.SetTickLength(ticklength)
+
+def forceStyle(name=None):
+    """Draws all the plots with the named style (e.g. SND-paper) instead of the one of their kind, None to reset."""
+    global forcedStyle
+    if name is not None and name not in STYLES: raise Exception('ERROR: unknown style '+name)
+    forcedStyle = name
+
+def init_style(cachefile=None):
+    # the base SND style as current style, see buildStyles for cachefile
+    global _current
+    buildStyles(cachefile)
+    _current = None
+    useStyle('SND')
+
+def ratioPads(canvas, ratiofrac=0.3, leftmargin=0.15, rightmargin=0.05, topmargin=0.05, bottommargin=0.15):
+    # splits the canvas in a main pad and a lower pad (ratio, pulls) sharing the x axis
+    canvas.cd()
+    upper = canvas.GetPrimitive(canvas.GetName()+'_upper')
+    lower = canvas.GetPrimitive(canvas.GetName()+'_lower')
+    if upper and lower:
+        # already split for a previous plot: the pads are cleared and reused
+        upper.Clear()
+        lower.Clear()
+        upper.SetPad(0., ratiofrac, 1., 1.)
+        lower.SetPad(0., 0., 1., ratiofrac)
+    else:
+        upper = ROOT.TPad(canvas.GetName()+'_upper', '', 0., ratiofrac, 1., 1.)
+        lower = ROOT.TPad(canvas.GetName()+'_lower', '', 0., 0., 1., ratiofrac)
+        for pad in (upper, lower):
+            # owned and deleted by the canvas
+            ROOT.SetOwnership(pad, False)
+            pad.SetBit(ROOT.kCanDelete)
+            pad.Draw()
+    for pad in (upper, lower):
+        pad.SetLeftMargin(leftmargin)
+        pad.SetRightMargin(rightmargin)
+    upper.SetTopMargin(topmargin/(1-ratiofrac))
+    upper.SetBottomMargin(0.02)
+    lower.SetTopMargin(0.03)
+    lower.SetBottomMargin(bottommargin/ratiofrac)
+    return upper, lower
+
+def _overlay(maintext, extratext, size, l, t, text_offset, text_in, rfrac):
+    # the text primitives of writeSND, built once per text, size and position
+    key = (maintext, extratext, size, l, t, text_offset, text_in, rfrac)
+    texts = _overlays.get(key)
+    if texts is not None:
+        _overlays.move_to_end(key)
+        return texts
+    texts = list()
+    sndX = size*2*(1-rfrac)
+    if not text_in: texts.append((maintext, 61, size, l, 1-t+text_offset))
+    else: texts.append((maintext, 61, size, l+0.03, 1-t-text_offset-1.2*size))
+    if extratext:
+        if not text_in: texts.append((extratext, 52, size*0.8, l+0.03+2.2*sndX, 1-t+text_offset))
+        else: texts.append((extratext, 52, size*0.8, l+0.03, 1-t-text_offset-2*size))
+    latexes = list()
+    for text, font, textsize, x, y in texts:
+        latex = ROOT.TLatex(x, y, text)
+        # shared by all the pads, never deleted by them (no kCanDelete); when evicted from the
+        # cache it is deleted, and removed from the pads still showing it (kMustCleanup)
+        ROOT.SetOwnership(latex, False)
+        latex.SetBit(ROOT.kMustCleanup)
+        latex.SetNDC()
+        latex.SetTextColor(ROOT.kBlack)
+        latex.SetTextFont(font)
+        latex.SetTextAlign(11)
+        latex.SetTextSize(textsize)
+        latexes.append(latex)
+    _overlays[key] = latexes
+    if len(_overlays) > _MAXOVERLAYS:
+        # the least recently used texts are deleted with their last python reference
+        for latex in _overlays.popitem(last=False)[1]: ROOT.SetOwnership(latex, True)
+    return latexes
+
+def setLogo(path=None):
+    """Image file drawn by writeSND in the top right corner of the frame, None for no logo."""
+    global logoFile, _logo
+    if path != logoFile: _logo = None
+    logoFile = path
+
+def _drawLogo(pad, size, text_in):
+    global _logo
+    if _logo is None:
+        # loaded once, the same image is drawn in all the pads
+        _logo = ROOT.TImage.Open(logoFile)
+        if not _logo: raise Exception('ERROR: cannot read the logo '+logoFile)
+        ROOT.SetOwnership(_logo, False)
+        _logo.SetConstRatio(True)
+    l, t, r = pad.GetLeftMargin(), pad.GetTopMargin(), pad.GetRightMargin()
+    height = 2.5*size if text_in else t
+    # the width in pad units giving the aspect ratio of the image
+    aspect = (pad.GetWh()*pad.GetAbsHNDC())/(pad.GetWw()*pad.GetAbsWNDC())
+    width = height*aspect*_logo.GetWidth()/_logo.GetHeight()
+    x2, y2 = (1-r-0.03, 1-t-0.03) if text_in else (1-r, 1.)
+    logopad = ROOT.TPad(pad.GetName()+'_logo', '', max(l, x2-width), y2-height, x2, y2)
+    # owned and deleted by the pad
+    ROOT.SetOwnership(logopad, False)
+    logopad.SetBit(ROOT.kCanDelete)
+    logopad.SetFillStyle(0)
+    logopad.SetMargin(0., 0., 0., 0.)
+    logopad.Draw()
+    logopad.cd()
+    _logo.Draw()
+    pad.cd()
 
 def writeSND(pad,
     text_factor=0.9,
@@ -114,38 +329,9 @@ def writeSND(pad,
     maintext='SND@LHC',
     drawLogo=True):
 
-    pad.Update()
-
-    l = pad.GetLeftMargin()
-    t = pad.GetTopMargin()
-    r = pad.GetRightMargin()
-    b = pad.GetBottomMargin()
-
-    SNDTextSize = t*text_factor
-    SNDTextVerticalOffset = text_offset
-
+    # the cached texts are attached to the pad, which is painted once when it is saved
+    size = pad.GetTopMargin()*text_factor
     pad.cd()
-
-    latex = ROOT.TLatex()
-    latex.SetNDC()
-    latex.SetTextAngle(0)
-    latex.SetTextColor(ROOT.kBlack)
-
-    latex.SetTextFont(61)
-    latex.SetTextAlign(11)
-    latex.SetTextSize(SNDTextSize)
-    latex.SetText(0,0,maintext)
-
-    sndX = SNDTextSize*2*(1-rfrac)
-
-    if not text_in: latex.DrawLatex(l, 1-t+SNDTextVerticalOffset, maintext)
-    else: latex.DrawLatex(l+0.03, 1-t-SNDTextVerticalOffset-1.2*SNDTextSize, maintext)
-
-    extraTextSize = SNDTextSize*0.8
-    latex.SetTextFont(52)
-    latex.SetTextSize(extraTextSize)
-    latex.SetTextAlign(11)
-    if not text_in: latex.DrawLatex(l+0.03 + 2.2*sndX, 1-t+SNDTextVerticalOffset, extratext)
-    else: latex.DrawLatex(l+0.03, 1-t-SNDTextVerticalOffset-2*SNDTextSize, extratext)
-
-    pad.Update()
\ No newline at end of file
+    for latex in _overlay(maintext, extratext, size, pad.GetLeftMargin(), pad.GetTopMargin(), text_offset, text_in, rfrac):
+        latex.Draw()
+    if drawLogo and logoFile: _drawLogo(pad, size, text_in)
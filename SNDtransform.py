@@ -0,0 +1,100 @@
+"""
+    SNDtransform.py    Non-destructive, memoized histogram transforms
+
+    Rebinning, scaling, normalization and 2D downsampling never modify the loaded histograms:
+    transform() derives a new histogram from the source and memoizes it, and every intermediate
+    result, by (source, chain of operations). The draw functions style and draw a throwaway
+    copy (drawCopy), so SetMaximum, titles and colours do not pile up on the shared histograms.
+    Several variants of the same plot (linear and log, raw and normalized) then cost one read
+    of the file, and the rebinned histogram is computed once for all of them.
+
+    Operations, applied in the given order:
+        ('rebin', n)                 merges the bins into n bins (as hist.Rebin(nbins/n))
+        ('varbins', edges)           variable bin edges, a tuple
+        ('scale', factor)
+        ('normalize',)               unit integral, nothing done for a null integral
+        ('downsample', nx, ny, mode) 2D histograms, see SNDstats.downsample2d
+"""
+from array import array
+
+import SNDstats
+from SNDstyle import ROOT
+
+_MAXMEMO = 2000
+# {(source key, chain of operations): derived histogram}
+_memo = {}
+
+
+def _sourceKey(hist):
+    # the address alone could be reused by a new histogram after the source is deleted
+    return (ROOT.addressof(hist), hist.GetName(), hist.GetNbinsX(), hist.GetEntries(), hist.GetSumOfWeights())
+
+def _apply(hist, op):
+    name = op[0]
+    if name == 'rebin':
+        new = hist.Rebin(int(hist.GetNbinsX()/op[1]), hist.GetName()+'_rebin')
+    elif name == 'varbins':
+        new = SNDstats.rebinVariable(hist, array('d', op[1]))
+    elif name == 'scale':
+        new = hist.Clone(hist.GetName()+'_scale')
+        new.Scale(op[1])
+    elif name == 'normalize':
+        new = hist.Clone(hist.GetName()+'_norm')
+        integral = SNDstats.histStats(hist)['integral'] if hist.GetDimension() == 1 else hist.Integral()
+        if integral != 0: new.Scale(1./integral)
+    elif name == 'downsample':
+        new = SNDstats.downsample2d(hist, op[1], op[2], op[3])
+        if new is hist: return hist
+    else:
+        raise Exception('ERROR: unknown histogram transform '+str(name))
+    new.SetName(hist.GetName())
+    new.SetDirectory(0)
+    ROOT.SetOwnership(new, True)
+    return new
+
+def transform(hist, *ops):
+    """hist with the operations (None are skipped) applied in order; hist itself is not modified."""
+    source = _sourceKey(hist)
+    chain = ()
+    result = hist
+    for op in ops:
+        if op is None: continue
+        chain += (op,)
+        derived = _memo.get((source, chain))
+        if derived is None:
+            derived = _apply(result, op)
+            if len(_memo) > _MAXMEMO: _memo.clear()
+            _memo[(source, chain)] = derived
+        result = derived
+    return result
+
+def prepare(hists, rebin=None, adaptive=None, scale=1., normalize=False):
+    """
+    The usual chain of the draw functions, rebin, adaptive rebinning (the same edges for
+    all hists, so that they can be overlaid), scale and normalize, as transformed copies.
+    """
+    ops = [('rebin', rebin) if rebin is not None else None]
+    if adaptive is not None:
+        edges = SNDstats.adaptiveEdges([transform(h, *ops) for h in hists], **adaptive)
+        if edges is not None: ops.append(('varbins', tuple(float(x) for x in edges)))
+    if scale != 1.: ops.append(('scale', scale))
+    if normalize: ops.append(('normalize',))
+    return [transform(h, *ops) for h in hists]
+
+def drawCopy(hist):
+    """Copy of hist to be styled and drawn, owned (and deleted) by the pad it is drawn in."""
+    copy = hist.Clone()
+    copy.SetDirectory(0)
+    ROOT.SetOwnership(copy, False)
+    copy.SetBit(ROOT.kCanDelete)
+    return copy
+
+def clearTransforms(hist=None):
+    """Frees the memoized transforms of hist, or all of them (and the cached statistics)."""
+    if hist is None:
+        _memo.clear()
+        SNDstats.clearCache()
+        return
+    source = _sourceKey(hist)
+    for key in [key for key in _memo if key[0] == source]:
+        del _memo[key]
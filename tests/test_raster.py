@@ -0,0 +1,41 @@
+"""
+    End-to-end runs of the --raster path of draw2dHisto, in a subprocess so that a crash of ROOT
+    fails the test instead of the whole session.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = pytest.importorskip('ROOT')
+
+PLOTTER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'SNDLHCplotter.py')
+
+
+def _writeHist(path):
+    f = ROOT.TFile.Open(path, 'RECREATE')
+    hist = ROOT.TH2D('h2', 'h2;x;y', 50, 0., 1., 40, 0., 1.)
+    rng = ROOT.TRandom3(1)
+    for i in range(5000):
+        hist.Fill(rng.Gaus(0.5, 0.2), rng.Gaus(0.5, 0.2))
+    hist.Write()
+    f.Close()
+
+def _run(cwd, *args):
+    return subprocess.run([sys.executable, PLOTTER]+list(args), cwd=str(cwd), capture_output=True, text=True, timeout=300)
+
+@pytest.mark.parametrize('extra', [[], ['--downsample', 'sum']])
+def test_raster_cli(tmp_path, extra):
+    _writeHist(str(tmp_path/'h2.root'))
+    result = _run(tmp_path, '-f', 'h2.root', '-hname', 'h2', '--auto', '--raster', '--formats', 'png,pdf', *extra)
+    assert result.returncode == 0, result.stdout+result.stderr
+    for fmt in ('png', 'pdf'):
+        assert os.path.getsize(str(tmp_path/'plots_h2'/('h2.'+fmt))) > 0
+
+def test_raster_auto_loop(tmp_path):
+    # the canvas of the auto loop is reused for the next plot after the raster one
+    _writeHist(str(tmp_path/'h2.root'))
+    result = _run(tmp_path, '-f', 'h2.root', '--auto', '--raster', '--formats', 'png')
+    assert result.returncode == 0, result.stdout+result.stderr
+    assert os.path.getsize(str(tmp_path/'plots_h2'/'h2.png')) > 0